@@ -0,0 +1,146 @@
+import time
+from typing import Dict
+from . import config
+from .lib import fusion360utils as futil
+
+# Optional instrumentation of the crossings into the adsk API. Objects wrapped by
+# an ApiCounter are replaced by proxies that count every property read, property
+# write and method call, with the time spent in it, per API method. Everything
+# returned by the API is wrapped as well, so wrapping the few root objects of a
+# command covers the whole command. When config.API_BUDGET is False wrap() returns
+# the objects unchanged and there is no overhead.
+
+class ApiBudgetExceeded(Exception):
+    pass
+
+def _is_api_object(value) -> bool:
+    return type(value).__module__.startswith('adsk.')
+
+def _unwrap(value):
+    return object.__getattribute__(value, '_obj') if isinstance(value, ApiProxy) else value
+
+class ApiCounter:
+    def __init__(self, name: str, enabled: bool = None):
+        self.name = name
+        self.enabled = config.API_BUDGET if enabled is None else enabled
+        self.calls = {} # API method -> [calls, seconds]
+
+    def wrap(self, value):
+        ''' Wrap an adsk object, or a list of them, so its API calls are counted '''
+        if not self.enabled or isinstance(value, ApiProxy):
+            return value
+        if isinstance(value, list):
+            return [self.wrap(item) for item in value]
+        if _is_api_object(value):
+            return ApiProxy(value, self)
+        return value
+
+    def record(self, method: str, seconds: float):
+        entry = self.calls.get(method)
+        if entry is None:
+            self.calls[method] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def total_calls(self, method: str = None) -> int:
+        if method is not None:
+            return self.calls.get(method, [0, 0.0])[0]
+        return sum(calls for calls, seconds in self.calls.values())
+
+    def total_time(self) -> float:
+        return sum(seconds for calls, seconds in self.calls.values())
+
+    def reset(self):
+        self.calls = {}
+
+    def assert_within(self, max_calls: int, method: str = None):
+        ''' Raise ApiBudgetExceeded when more than max_calls API calls were made, in total or to a single method '''
+        calls = self.total_calls(method)
+        if calls > max_calls:
+            raise ApiBudgetExceeded(f'{self.name}: {calls} calls to {method or "the API"} exceed the budget of {max_calls}\n{self.summary()}')
+
+    def summary(self) -> str:
+        output = [f'API calls of {self.name}: {self.total_calls()} calls, {self.total_time():.5f} seconds']
+        # most expensive methods first
+        for method, (calls, seconds) in sorted(self.calls.items(), key=lambda item: item[1][1], reverse=True):
+            output.append(f'\t{method}\t\tCalls: {calls}\tTime: {seconds:.5f} seconds')
+        return '\n'.join(output)
+
+    def log_summary(self):
+        if self.enabled:
+            futil.log(self.summary())
+
+class ApiProxy:
+    __slots__ = ('_obj', '_counter')
+
+    def __init__(self, obj, counter: ApiCounter):
+        object.__setattr__(self, '_obj', obj)
+        object.__setattr__(self, '_counter', counter)
+
+    def __getattr__(self, name):
+        obj = object.__getattribute__(self, '_obj')
+        counter = object.__getattribute__(self, '_counter')
+        method = f'{type(obj).__name__}.{name}'
+        start = time.perf_counter()
+        value = getattr(obj, name)
+        if not callable(value): # property read
+            counter.record(method, time.perf_counter() - start)
+            return counter.wrap(value)
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            result = value(*[_unwrap(arg) for arg in args], **{key: _unwrap(arg) for key, arg in kwargs.items()})
+            counter.record(method, time.perf_counter() - start)
+            return counter.wrap(result)
+        return call
+
+    def __setattr__(self, name, value):
+        obj = object.__getattribute__(self, '_obj')
+        counter = object.__getattribute__(self, '_counter')
+        start = time.perf_counter()
+        setattr(obj, name, _unwrap(value))
+        counter.record(f'{type(obj).__name__}.{name} (set)', time.perf_counter() - start)
+
+    def __iter__(self):
+        obj = object.__getattribute__(self, '_obj')
+        counter = object.__getattribute__(self, '_counter')
+        method = f'{type(obj).__name__}.__iter__'
+        iterator = iter(obj)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                counter.record(method, time.perf_counter() - start)
+                return
+            counter.record(method, time.perf_counter() - start)
+            yield counter.wrap(item)
+
+    def __len__(self):
+        obj = object.__getattribute__(self, '_obj')
+        counter = object.__getattribute__(self, '_counter')
+        start = time.perf_counter()
+        length = len(obj)
+        counter.record(f'{type(obj).__name__}.__len__', time.perf_counter() - start)
+        return length
+
+    def __getitem__(self, index):
+        obj = object.__getattribute__(self, '_obj')
+        counter = object.__getattribute__(self, '_counter')
+        start = time.perf_counter()
+        item = obj[index]
+        counter.record(f'{type(obj).__name__}.__getitem__', time.perf_counter() - start)
+        return counter.wrap(item)
+
+    def __bool__(self):
+        return bool(object.__getattribute__(self, '_obj'))
+
+    def __eq__(self, other):
+        return object.__getattribute__(self, '_obj') == _unwrap(other)
+
+    def __hash__(self):
+        return hash(object.__getattribute__(self, '_obj'))
+
+    def __repr__(self):
+        return f'ApiProxy({object.__getattribute__(self, "_obj")!r})'
@@ -1,12 +1,19 @@
 from .genPanels import entry as genPanels
 from .settings import entry as settings
 from .. import shared_state
+from .. import library_catalog
 import os
 
 from .syncLibrary import entry as syncLibrary
+from .rollbackSync import entry as rollbackSync
+from .bulkEdit import entry as bulkEdit
+from .libraryReport import entry as libraryReport
 
 commands = [
-    syncLibrary
+    syncLibrary,
+    rollbackSync,
+    bulkEdit,
+    libraryReport
 ]
 
 default_settings: dict = {}
@@ -23,11 +30,38 @@ ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource
 
 shared_state.load_settings_init("FEATURE_ENABLEMENT", "Settings", default_settings, ICON_FOLDER)
 
+# Folders behind the local and external library locations, watched to keep the library catalog current
+catalog_settings: dict = {
+    "watch_library_folders": {
+        "type": "checkbox",
+        "label": "Watch Library Folders",
+        "tooltip": "Keeps a catalog of the library files in the folders below, so a sync can tell which library holds a tool it could not match. Changes apply after restarting the add-in.",
+        "default": False
+    },
+    "local_library_folder": {
+        "type": "string",
+        "label": "Local Library Folder",
+        "tooltip": "Changes apply after restarting the add-in.",
+        "default": library_catalog.default_local_library_folder()
+    },
+    "external_library_folders": {
+        "type": "string",
+        "label": "External Library Folders",
+        "tooltip": "Folders linked as external tool libraries, separated by ;. Changes apply after restarting the add-in.",
+        "default": ""
+    }
+}
+shared_state.load_settings_init("LIBRARY_CATALOG", "Library Catalog", catalog_settings, ICON_FOLDER)
+
 def start():
     genPanels.start() # we need to make the panels that we are going to use first
     settings.start(commands)
+    catalog_settings = shared_state.load_settings("LIBRARY_CATALOG")
+    if catalog_settings["watch_library_folders"]["default"]: # the catalog tells which watched library holds a tool the sync could not match
+        library_catalog.start(catalog_settings["local_library_folder"]["default"], catalog_settings["external_library_folders"]["default"].split(';'))
 
 def stop():
+    library_catalog.stop()
     for command in commands:
         command.stop()
     settings.stop()
@@ -0,0 +1,249 @@
+import adsk.core, adsk.fusion, adsk.cam, traceback
+import os
+from ...lib import fusion360utils as futil
+from ... import config
+from ... import journal
+from ... import shared_state
+from ..syncLibrary import entry as syncLibrary
+from ..syncLibrary.merge import valuesMatch
+from . import expressions
+from typing import List, Dict
+
+app = adsk.core.Application.get()
+ui: adsk.core.UserInterface = app.userInterface
+
+CMD_ID = f'{config.COMPANY_NAME}_{config.ADDIN_NAME}_Bulk_Edit_Tools'
+CMD_NAME = 'Bulk Edit Tools'
+CMD_Description = 'Change tool or preset parameters of every tool matching a filter'
+IS_PROMOTED = False
+
+WORKSPACE_ID = 'CAMEnvironment'
+PANEL_ID = 'CAMManagePanel'
+COMMAND_BESIDE_ID = ''
+
+ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', '')
+
+DOCUMENT_LIBRARY = 'Document'
+PREVIEW_LINES = 15
+
+# The execute and destroy handlers of each dialog are registered under CMD_ID
+# and released when the dialog is destroyed.
+
+def start():
+    cmd_def = ui.commandDefinitions.addButtonDefinition(CMD_ID, CMD_NAME, CMD_Description, ICON_FOLDER)
+    futil.add_handler(cmd_def.commandCreated, command_created)
+    workspace = ui.workspaces.itemById(WORKSPACE_ID)
+    panel = workspace.toolbarPanels.itemById(PANEL_ID)
+    control = panel.controls.addCommand(cmd_def, COMMAND_BESIDE_ID, False)
+    control.isPromoted = IS_PROMOTED
+
+def stop():
+    # Get the various UI elements for this command
+    workspace = ui.workspaces.itemById(WORKSPACE_ID)
+    panel = workspace.toolbarPanels.itemById(PANEL_ID)
+    command_control = panel.controls.itemById(CMD_ID)
+    command_definition = ui.commandDefinitions.itemById(CMD_ID)
+
+    if command_control:
+        command_control.deleteMe()
+
+    if command_definition:
+        command_definition.deleteMe()
+
+def command_created(args: adsk.core.CommandCreatedEventArgs):
+    # General logging for debug.
+    futil.log(f'>>> {CMD_NAME} Command Created Event')
+    futil.add_handler(args.command.execute, command_execute, group=CMD_ID)
+    futil.add_handler(args.command.destroy, command_destroy, group=CMD_ID)
+
+    inputs = args.command.commandInputs
+
+    # Option to edit the document tools or one of the tooling libraries
+    library_input = inputs.addDropDownCommandInput('library', 'Library', adsk.core.DropDownStyles.TextListDropDownStyle)
+    library_input.tooltipDescription = 'Select the tools you would like to edit.'
+    library_input.listItems.add(DOCUMENT_LIBRARY, True)
+    for library in syncLibrary.format_library_names(syncLibrary.get_tooling_libraries()):
+        library_input.listItems.add(library, False)
+
+    # Edit the tools themselves or each of their presets
+    scope_input = inputs.addDropDownCommandInput('scope', 'Edit', adsk.core.DropDownStyles.TextListDropDownStyle)
+    scope_input.listItems.add('Tools', True)
+    scope_input.listItems.add('Presets', False)
+    scope_input.tooltipDescription = 'When editing presets, names refer to the preset parameter first, then the tool parameter. preset_name holds the name of the preset.'
+
+    filter_input = inputs.addStringValueInput('filter', 'Filter', '')
+    filter_input.tooltipDescription = 'Expression selecting the tools to edit, e.g. contains(preset_name, \'aluminum\') and tool_diameter < 1. Leave empty to edit all tools.'
+
+    assignments_input = inputs.addTextBoxCommandInput('assignments', 'Assignments', '', 4, False)
+    assignments_input.tooltipDescription = 'One \'parameter = expression\' per line, e.g. tool_surfaceSpeed = tool_surfaceSpeed * 0.9. All expressions use the values from before the edit.'
+
+def command_execute(args: adsk.core.CommandEventArgs):
+    inputs = args.command.commandInputs
+    library_input: adsk.core.DropDownCommandInput = inputs.itemById('library')
+    scope_input: adsk.core.DropDownCommandInput = inputs.itemById('scope')
+    presets_mode = scope_input.selectedItem.name == 'Presets'
+    filter_input: adsk.core.StringValueCommandInput = inputs.itemById('filter')
+    assignments_input: adsk.core.TextBoxCommandInput = inputs.itemById('assignments')
+
+    # Compile everything once before touching any tool
+    try:
+        toolFilter = expressions.compile_filter(filter_input.value)
+        assignments = expressions.compile_assignments(assignments_input.text)
+    except expressions.ExpressionError as error:
+        ui.messageBox(str(error), 'Bulk Edit')
+        return
+    names = set(toolFilter.names)
+    for target, expression in assignments:
+        names.add(target)
+        names |= expression.names
+    names.discard('preset_name')
+
+    camManager = adsk.cam.CAMManager.get()
+    toolLibraries = camManager.libraryManager.toolLibraries
+    if library_input.selectedItem.name == DOCUMENT_LIBRARY:
+        cam = adsk.cam.CAM.cast(app.activeProduct)
+        library = cam.documentToolLibrary
+        library_url = None
+        library_url_string = ''
+        side = journal.DOCUMENT
+    else:
+        libraries = syncLibrary.get_tooling_libraries()
+        library_index = syncLibrary.format_library_names(libraries).index(library_input.selectedItem.name)
+        library_url_string = libraries[library_index]
+        library_url = adsk.core.URL.create(library_url_string)
+        library = toolLibraries.toolLibraryAtURL(library_url)
+        side = journal.LIBRARY
+
+    rows, toolNumbers = readRows(library, names, presets_mode)
+    changes = computeChanges(rows, toolFilter, assignments, presets_mode)
+    if not changes:
+        ui.messageBox('No values would change. See log for details', 'Bulk Edit')
+        return
+
+    # Preview the diff before anything is written
+    previewLines = [formatChange(change) for change in changes]
+    futil.log(f'Bulk edit of \'{library_input.selectedItem.name}\' will change the following values: <<<<<<<<<<')
+    for line in previewLines:
+        futil.log(line)
+    toolCount = len(set(id(change['row']['tool']) for change in changes))
+    preview = '\n'.join(previewLines[:PREVIEW_LINES]) + ('\n...' if len(previewLines) > PREVIEW_LINES else '')
+    buttonClicked = ui.messageBox(f'{len(changes)} values of {toolCount} tools in \'{library_input.selectedItem.name}\' will change: \n\n{preview}\n\nSee log for the full list.', "Verify Bulk Edit.",1,2) #0 OK, -1 Error, 1 Cancel, 2 Yes or Retry, 3 No
+    match buttonClicked:
+        case 0:
+            pass
+        case 1:
+            return
+
+    # Changes are journaled by tool number, so they can only be rolled back when tool numbers are unique
+    bulkJournal = None
+    if len(set(toolNumbers)) == len(toolNumbers):
+        bulkJournal = journal.SyncJournal('BulkEdit', library_input.selectedItem.name, library_url_string, 'tool_number', app.activeDocument.name, shared_state.get_document_id(app.activeDocument))
+    else:
+        futil.log('Tool numbers are not unique, this bulk edit cannot be rolled back')
+
+    try:
+        changedTools = applyChanges(changes, side, bulkJournal)
+    finally:
+        if bulkJournal:
+            bulkJournal.close()
+
+    # Same single update calls the sync uses
+    if side == journal.DOCUMENT:
+        for tool in changedTools:
+            library.update(tool, True)
+    elif changedTools:
+        toolLibraries.updateToolLibrary(library_url, library)
+
+    ui.messageBox('Bulk edit completed. See log for details')
+
+# This event handler is called when the command terminates.
+def command_destroy(args: adsk.core.CommandEventArgs):
+    futil.release_handlers(CMD_ID)
+    futil.log(f'>>> {CMD_NAME} Command Destroy Event')
+
+def readValues(parameters, names) -> Dict:
+    ''' Read only the parameters used by the expressions '''
+    values = {}
+    for name in names:
+        parameter = parameters.itemByName(name)
+        if parameter:
+            values[name] = parameter.value.value
+    return values
+
+def readRows(library, names, presets_mode: bool):
+    ''' One row per tool, or per preset when editing presets. Also returns the tool numbers of all tools '''
+    names = set(names) | {'tool_number'}
+    rows = []
+    toolNumbers = []
+    for index, tool in enumerate(library):
+        toolValues = readValues(tool.parameters, names)
+        toolNumbers.append(toolValues.get('tool_number'))
+        if not presets_mode:
+            rows.append({'tool': tool, 'index': index, 'preset': None, 'values': toolValues})
+            continue
+        for preset in tool.presets:
+            values = {**toolValues, **readValues(preset.parameters, names), 'preset_name': preset.name}
+            rows.append({'tool': tool, 'index': index, 'preset': preset, 'values': values})
+    return rows, toolNumbers
+
+def evaluateColumn(expression: expressions.CompiledExpression, rows: List[Dict]) -> List:
+    ''' Evaluate a compiled expression over all rows. Rows missing a parameter or failing to evaluate get None '''
+    results = []
+    errors = 0
+    for row in rows:
+        try:
+            results.append(expression.evaluate(row['values']))
+        except Exception as error:
+            results.append(None)
+            errors += 1
+            if errors <= 5:
+                futil.log(f'{row["values"].get("tool_number")} could not evaluate \'{expression.source.strip()}\': {error}')
+    if errors > 5:
+        futil.log(f'\'{expression.source.strip()}\' could not be evaluated for {errors} tools')
+    return results
+
+def computeChanges(rows: List[Dict], toolFilter: expressions.CompiledExpression, assignments, presets_mode: bool) -> List[Dict]:
+    rows = [row for row, keep in zip(rows, evaluateColumn(toolFilter, rows)) if keep]
+    futil.log(f'Bulk edit filter matched {len(rows)} {"presets" if presets_mode else "tools"}')
+
+    changes = []
+    for target, expression in assignments:
+        for row, newValue in zip(rows, evaluateColumn(expression, rows)):
+            if newValue is None:
+                continue
+            parameters = row['preset'].parameters if presets_mode else row['tool'].parameters
+            if target not in row['values'] or not parameters.itemByName(target):
+                futil.log(f'{row["values"].get("tool_number")} has no parameter \'{target}\'')
+                continue
+            oldValue = row['values'][target]
+            if not valuesMatch(oldValue, newValue):
+                changes.append({'row': row, 'parameter': target, 'old': oldValue, 'new': newValue})
+    return changes
+
+def formatChange(change: Dict) -> str:
+    row = change['row']
+    label = change['parameter'] if row['preset'] is None else row['preset'].name + '\',\'' + change['parameter']
+    return str(row['values'].get('tool_number')) + ' \'' + label + '\' ' + str(change['old']) + ' -> ' + str(change['new'])
+
+def applyChanges(changes: List[Dict], side: str, bulkJournal) -> List:
+    ''' Write the changes to the tools. Returns the tools that were changed '''
+    changedTools = {}
+    toolNumbers = {} # tool number of each changed tool after its changes so far
+    for change in changes:
+        row = change['row']
+        toolNumber = toolNumbers.get(id(row['tool']), row['values'].get('tool_number'))
+        target = row['tool'] if row['preset'] is None else row['preset']
+        try:
+            target.parameters.itemByName(change['parameter']).value.value = change['new']
+        except:
+            futil.log('Failed to set ' + formatChange(change))
+            continue
+        changedTools[id(row['tool'])] = row['tool']
+        if change['parameter'] == 'tool_number' and row['preset'] is None:
+            toolNumber = toolNumbers[id(row['tool'])] = change['new']
+        if bulkJournal:
+            if row['preset'] is None:
+                bulkJournal.record_parameter(side, toolNumber, row['index'], change['parameter'], change['old'], change['new'])
+            else:
+                bulkJournal.record_preset_parameter(side, toolNumber, row['index'], row['preset'].name, change['parameter'], change['old'], change['new'])
+    return list(changedTools.values())
@@ -0,0 +1,118 @@
+import ast
+import math
+from typing import List, Dict, Tuple
+
+# Bulk edit expressions are a small subset of python expressions over tool and
+# preset parameter names. They are checked against this whitelist and compiled
+# once, then evaluated for every matched tool without access to any builtins.
+FUNCTIONS = {
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'round': round,
+    'float': float,
+    'int': int,
+    'str': str,
+    'sqrt': math.sqrt,
+    'floor': math.floor,
+    'ceil': math.ceil,
+    'pi': math.pi,
+    'lower': lambda value: str(value).lower(),
+    'upper': lambda value: str(value).upper(),
+    'contains': lambda value, text: str(text).lower() in str(value).lower()
+}
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div,
+    ast.FloorDiv, ast.Mod, ast.Pow, ast.UnaryOp, ast.USub, ast.UAdd, ast.Not, ast.Compare, ast.Eq,
+    ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.IfExp, ast.Name, ast.Load,
+    ast.Constant, ast.Call, ast.Tuple, ast.List
+)
+
+# Powers are limited to small constant exponents, so an expression cannot build huge numbers
+MAX_EXPONENT = 16
+
+class ExpressionError(Exception):
+    pass
+
+def _is_small_exponent(node) -> bool:
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        node = node.operand
+    return isinstance(node, ast.Constant) and type(node.value) in (int, float) and abs(node.value) <= MAX_EXPONENT
+
+# Repeating text or sequences ('a' * n, '%*d' % (n, 0)) can allocate gigabytes, so * and % only
+# accept numbers. Parameters are only known when evaluating, so both are checked at runtime.
+SEQUENCES = (str, list, tuple)
+
+def _multiply(a, b):
+    if isinstance(a, SEQUENCES) or isinstance(b, SEQUENCES):
+        raise ExpressionError('Only numbers can be multiplied')
+    return a * b
+
+def _modulo(a, b):
+    if isinstance(a, SEQUENCES) or isinstance(b, SEQUENCES):
+        raise ExpressionError('Only numbers can be used with %')
+    return a % b
+
+CHECKED_OPERATORS = {ast.Mult: '_multiply', ast.Mod: '_modulo'}
+CHECKED_FUNCTIONS = {'_multiply': _multiply, '_modulo': _modulo}
+
+class _CheckOperators(ast.NodeTransformer):
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        name = CHECKED_OPERATORS.get(type(node.op))
+        if name is None:
+            return node
+        return ast.copy_location(ast.Call(func=ast.Name(name, ast.Load()), args=[node.left, node.right], keywords=[]), node)
+
+class CompiledExpression:
+    def __init__(self, source: str):
+        self.source = source
+        try:
+            tree = ast.parse(source.strip(), mode='eval')
+        except SyntaxError as error:
+            raise ExpressionError(f'\'{source}\' is not a valid expression: {error.msg}')
+        self.names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ExpressionError(f'\'{source}\' uses \'{type(node).__name__}\', which is not allowed')
+            if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords):
+                raise ExpressionError(f'\'{source}\' calls a function that is not allowed. Allowed functions: {", ".join(FUNCTIONS)}')
+            if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+                self.names.add(node.id)
+            if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+                nested = any(isinstance(child, ast.BinOp) and isinstance(child.op, ast.Pow) for child in ast.walk(node.left))
+                if nested or not _is_small_exponent(node.right):
+                    raise ExpressionError(f'\'{source}\' raises to a power that is not allowed. Exponents must be numbers between -{MAX_EXPONENT} and {MAX_EXPONENT}')
+            if isinstance(node, ast.BinOp) and type(node.op) in CHECKED_OPERATORS:
+                for operand in (node.left, node.right):
+                    if isinstance(operand, (ast.List, ast.Tuple)) or (isinstance(operand, ast.Constant) and isinstance(operand.value, str)):
+                        raise ExpressionError(f'\'{source}\' repeats or formats text, which is not allowed. Only numbers can be used with * and %')
+        tree = ast.fix_missing_locations(_CheckOperators().visit(tree))
+        self.code = compile(tree, '<bulk edit>', 'eval')
+
+    def evaluate(self, row: Dict):
+        return eval(self.code, {'__builtins__': {}, **FUNCTIONS, **CHECKED_FUNCTIONS}, row)
+
+def compile_filter(source: str) -> CompiledExpression:
+    ''' An empty filter matches every tool '''
+    return CompiledExpression(source if source.strip() else 'True')
+
+def compile_assignments(source: str) -> List[Tuple[str, CompiledExpression]]:
+    ''' Compile one "parameter = expression" assignment per line. Lines starting with # are ignored '''
+    assignments = []
+    for line in source.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            statement = ast.parse(line, mode='exec').body
+        except SyntaxError as error:
+            raise ExpressionError(f'\'{line}\' is not a valid assignment: {error.msg}')
+        if len(statement) != 1 or not isinstance(statement[0], ast.Assign) or len(statement[0].targets) != 1 or not isinstance(statement[0].targets[0], ast.Name):
+            raise ExpressionError(f'\'{line}\' is not an assignment of the form \'parameter = expression\'')
+        target = statement[0].targets[0].id
+        assignments.append((target, CompiledExpression(line.split('=', 1)[1])))
+    if not assignments:
+        raise ExpressionError('No assignments were given')
+    return assignments
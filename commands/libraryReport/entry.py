@@ -0,0 +1,195 @@
+import adsk.core, adsk.fusion, adsk.cam, traceback
+import csv
+import hashlib
+import html
+import json
+import os
+from ...lib import fusion360utils as futil
+from ... import config
+from ... import shared_state
+from ..syncLibrary import entry as syncLibrary
+from typing import List, Dict
+
+app = adsk.core.Application.get()
+ui: adsk.core.UserInterface = app.userInterface
+
+CMD_ID = f'{config.COMPANY_NAME}_{config.ADDIN_NAME}_Library_Health_Report'
+CMD_NAME = 'Library Health Report'
+CMD_Description = 'Tool counts, filled match keys, duplicates and presets of every tool library'
+IS_PROMOTED = False
+
+WORKSPACE_ID = 'CAMEnvironment'
+PANEL_ID = 'CAMManagePanel'
+COMMAND_BESIDE_ID = ''
+
+ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', '')
+
+# Statistics are cached by library content hash, so unchanged libraries are not read again
+CACHE_FILE = os.path.join(shared_state.settings_dir, 'LibraryReportCache.json')
+
+# Same match keys the sync offers
+MATCH_KEYS = {
+    'Tool Number': 'tool_number',
+    'Comment': 'tool_comment',
+    'Product ID': 'tool_productId',
+    'Description': 'tool_description'
+}
+
+# The execute and destroy handlers of each dialog are registered under CMD_ID
+# and released when the dialog is destroyed.
+
+def start():
+    cmd_def = ui.commandDefinitions.addButtonDefinition(CMD_ID, CMD_NAME, CMD_Description, ICON_FOLDER)
+    futil.add_handler(cmd_def.commandCreated, command_created)
+    workspace = ui.workspaces.itemById(WORKSPACE_ID)
+    panel = workspace.toolbarPanels.itemById(PANEL_ID)
+    control = panel.controls.addCommand(cmd_def, COMMAND_BESIDE_ID, False)
+    control.isPromoted = IS_PROMOTED
+
+def stop():
+    # Get the various UI elements for this command
+    workspace = ui.workspaces.itemById(WORKSPACE_ID)
+    panel = workspace.toolbarPanels.itemById(PANEL_ID)
+    command_control = panel.controls.itemById(CMD_ID)
+    command_definition = ui.commandDefinitions.itemById(CMD_ID)
+
+    if command_control:
+        command_control.deleteMe()
+
+    if command_definition:
+        command_definition.deleteMe()
+
+def command_created(args: adsk.core.CommandCreatedEventArgs):
+    # General logging for debug.
+    futil.log(f'>>> {CMD_NAME} Command Created Event')
+    futil.add_handler(args.command.execute, command_execute, group=CMD_ID)
+    futil.add_handler(args.command.destroy, command_destroy, group=CMD_ID)
+
+    inputs = args.command.commandInputs
+
+    export_input = inputs.addDropDownCommandInput('export', 'Export', adsk.core.DropDownStyles.TextListDropDownStyle)
+    export_input.listItems.add('Log Only', True)
+    export_input.listItems.add('CSV', False)
+    export_input.listItems.add('HTML', False)
+    export_input.tooltipDescription = 'The report is always written to the log, and can also be saved as a CSV or HTML file.'
+
+def command_execute(args: adsk.core.CommandEventArgs):
+    inputs = args.command.commandInputs
+    export_input: adsk.core.DropDownCommandInput = inputs.itemById('export')
+    export_type = export_input.selectedItem.name
+
+    camManager = adsk.cam.CAMManager.get()
+    toolLibraries = camManager.libraryManager.toolLibraries
+    libraries = syncLibrary.get_tooling_libraries()
+    formatted_libraries = syncLibrary.format_library_names(libraries)
+
+    cache = load_cache()
+    report = []
+    cached = 0
+    for library_url_string, library_name in zip(libraries, formatted_libraries):
+        try:
+            # Hashing the whole library is a single API call, reading its tools is several per tool
+            library = toolLibraries.toolLibraryAtURL(adsk.core.URL.create(library_url_string))
+            content_hash = hashlib.sha1(library.toJson().encode('utf-8')).hexdigest()
+            entry = cache.get(library_url_string)
+            if entry and entry['hash'] == content_hash:
+                statistics = entry['statistics']
+                cached += 1
+            else:
+                statistics = libraryStatistics(library)
+                cache[library_url_string] = {'hash': content_hash, 'statistics': statistics}
+            report.append({'library': library_name, 'url': library_url_string, **statistics})
+        except:
+            futil.handle_error(f'{CMD_NAME}: {library_name}')
+
+    # Drop libraries that no longer exist
+    save_cache({url: entry for url, entry in cache.items() if url in libraries})
+
+    futil.log(f'Library health report ({cached} of {len(report)} libraries unchanged since the last report): <<<<<<<<<<')
+    for row in report:
+        futil.log(formatRow(row))
+
+    if export_type != 'Log Only':
+        fileDialog = ui.createFileDialog()
+        fileDialog.title = 'Save Library Health Report'
+        fileDialog.filter = 'CSV (*.csv)' if export_type == 'CSV' else 'HTML (*.html)'
+        fileDialog.initialFilename = 'Library Health Report'
+        if fileDialog.showSave() != adsk.core.DialogResults.DialogOK:
+            return
+        if export_type == 'CSV':
+            write_csv(fileDialog.filename, report)
+        else:
+            write_html(fileDialog.filename, report)
+        futil.log(f'Library health report saved to {fileDialog.filename}')
+
+    ui.messageBox(f'Library health report of {len(report)} libraries completed. See log for details')
+
+# This event handler is called when the command terminates.
+def command_destroy(args: adsk.core.CommandEventArgs):
+    futil.release_handlers(CMD_ID)
+    futil.log(f'>>> {CMD_NAME} Command Destroy Event')
+
+def libraryStatistics(library) -> Dict:
+    ''' Tool count, filled and duplicated match keys and preset count of a library in a single pass over its tools '''
+    toolCount = 0
+    presetCount = 0
+    filled = {key: 0 for key in MATCH_KEYS}
+    counters = {key: {} for key in MATCH_KEYS}
+    for tool in library:
+        toolCount += 1
+        presetCount += tool.presets.count
+        for key, parameterName in MATCH_KEYS.items():
+            parameter = tool.parameters.itemByName(parameterName)
+            value = parameter.value.value if parameter else None
+            if value is None or value == '':
+                continue
+            filled[key] += 1
+            counters[key][value] = counters[key].get(value, 0) + 1
+
+    statistics = {'tools': toolCount, 'presets': presetCount}
+    for key in MATCH_KEYS:
+        # tools sharing their value with at least one other tool
+        duplicates = sum(count for count in counters[key].values() if count > 1)
+        statistics[f'{key} filled'] = filled[key] / toolCount if toolCount else 0.0
+        statistics[f'{key} duplicates'] = duplicates / toolCount if toolCount else 0.0
+    return statistics
+
+def reportColumns() -> List[str]:
+    columns = ['library', 'tools', 'presets']
+    for key in MATCH_KEYS:
+        columns += [f'{key} filled', f'{key} duplicates']
+    return columns
+
+def formatValue(value) -> str:
+    return f'{value:.1%}' if isinstance(value, float) else str(value)
+
+def formatRow(row: Dict) -> str:
+    return ', '.join(f'{column}: {formatValue(row[column])}' for column in reportColumns())
+
+def write_csv(path: str, report: List[Dict]):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as file: # BOM so Excel reads the library names as UTF-8
+        writer = csv.writer(file)
+        writer.writerow(reportColumns())
+        for row in report:
+            writer.writerow([row[column] for column in reportColumns()])
+
+def write_html(path: str, report: List[Dict]):
+    header = ''.join(f'<th>{html.escape(column)}</th>' for column in reportColumns())
+    rows = ''.join('<tr>' + ''.join(f'<td>{html.escape(formatValue(row[column]))}</td>' for column in reportColumns()) + '</tr>\n' for row in report)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Library Health Report</title>\n'
+                   f'<style>table {{border-collapse: collapse}} th, td {{border: 1px solid #999; padding: 4px 8px}}</style></head>\n'
+                   f'<body><h1>Library Health Report</h1>\n<table>\n<tr>{header}</tr>\n{rows}</table></body></html>\n')
+
+def load_cache() -> Dict:
+    if os.path.exists(CACHE_FILE):
+        try:
+            with open(CACHE_FILE, 'r') as file:
+                return json.load(file)
+        except ValueError: # damaged cache, everything is read again
+            pass
+    return {}
+
+def save_cache(cache: Dict):
+    with open(CACHE_FILE, 'w') as file:
+        json.dump(cache, file, indent=4)
@@ -0,0 +1,228 @@
+import adsk.core, adsk.fusion, adsk.cam, traceback
+import os
+from ...lib import fusion360utils as futil
+from ... import config
+from ... import journal
+from ... import shared_state
+from ..syncLibrary.merge import valuesMatch
+from ..syncLibrary import baseline
+from typing import List, Dict
+
+app = adsk.core.Application.get()
+ui: adsk.core.UserInterface = app.userInterface
+
+CMD_ID = f'{config.COMPANY_NAME}_{config.ADDIN_NAME}_Rollback_Sync'
+CMD_NAME = 'Rollback Sync'
+CMD_Description = 'Undo the changes made by a previous synchronization'
+IS_PROMOTED = False
+
+WORKSPACE_ID = 'CAMEnvironment'
+PANEL_ID = 'CAMManagePanel'
+COMMAND_BESIDE_ID = ''
+
+ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', '')
+
+# The execute and destroy handlers of each dialog are registered under CMD_ID
+# and released when the dialog is destroyed.
+
+def start():
+    cmd_def = ui.commandDefinitions.addButtonDefinition(CMD_ID, CMD_NAME, CMD_Description, ICON_FOLDER)
+    futil.add_handler(cmd_def.commandCreated, command_created)
+    workspace = ui.workspaces.itemById(WORKSPACE_ID)
+    panel = workspace.toolbarPanels.itemById(PANEL_ID)
+    control = panel.controls.addCommand(cmd_def, COMMAND_BESIDE_ID, False)
+    control.isPromoted = IS_PROMOTED
+
+def stop():
+    # Get the various UI elements for this command
+    workspace = ui.workspaces.itemById(WORKSPACE_ID)
+    panel = workspace.toolbarPanels.itemById(PANEL_ID)
+    command_control = panel.controls.itemById(CMD_ID)
+    command_definition = ui.commandDefinitions.itemById(CMD_ID)
+
+    if command_control:
+        command_control.deleteMe()
+
+    if command_definition:
+        command_definition.deleteMe()
+
+def command_created(args: adsk.core.CommandCreatedEventArgs):
+    # General logging for debug.
+    futil.log(f'>>> {CMD_NAME} Command Created Event')
+    futil.add_handler(args.command.execute, command_execute, group=CMD_ID)
+    futil.add_handler(args.command.destroy, command_destroy, group=CMD_ID)
+
+    inputs = args.command.commandInputs
+
+    # Newest journal is selected so a rollback of the last sync is a single click
+    journal_input = inputs.addDropDownCommandInput('journal', 'Sync Run', adsk.core.DropDownStyles.TextListDropDownStyle)
+    journal_input.tooltipDescription = 'Select the synchronization you would like to undo.'
+    journals = journal.list_journals()
+    for index, path in enumerate(journals):
+        journal_input.listItems.add(journal.format_journal_name(path), index == 0)
+    if not journals:
+        args.command.isOKButtonVisible = False
+        inputs.addTextBoxCommandInput('noJournals', '', 'There are no synchronizations to roll back.', 1, True)
+
+def command_execute(args: adsk.core.CommandEventArgs):
+    inputs = args.command.commandInputs
+    journal_input: adsk.core.DropDownCommandInput = inputs.itemById('journal')
+    if not journal_input.selectedItem:
+        return
+    journals = journal.list_journals()
+    journal_path = [path for path in journals if journal.format_journal_name(path) == journal_input.selectedItem.name][0]
+    header, deltas = journal.read_journal(journal_path)
+    baselineDeltas = [delta for delta in deltas if delta['kind'] == journal.BASELINE]
+    deltas = [delta for delta in deltas if delta['kind'] != journal.BASELINE]
+
+    # Journals are listed newest first, rolling back an older one over newer changes of the same tools restores stale values
+    newerJournals = journals[:journals.index(journal_path)]
+    overlapping = newerOverlappingJournals(header, deltas, newerJournals)
+    warning = ''
+    if overlapping:
+        futil.log(f'Rollback: newer synchronizations changed the same tools: {", ".join(overlapping)}')
+        warning = f'\n\nWarning: {len(overlapping)} newer synchronizations that were not rolled back changed the same tools. Roll those back first, values changed since are skipped.'
+
+    # User verify that the right sync is rolled back
+    buttonClicked = ui.messageBox(f'The following synchronization will be rolled back: \n\nTime: {header["time"]} \nLibrary: {header["library_name"]} \nDocument: {header["document_name"]} \nDirection: {header["direction"]} \nChanges: {len(deltas)}{warning}', "Verify Rollback.",1,2) #0 OK, -1 Error, 1 Cancel, 2 Yes or Retry, 3 No
+    match buttonClicked:
+        case 0:
+            futil.log(f'Rolling back {journal.format_journal_name(journal_path)} ({len(deltas)} changes)')
+        case 1:
+            return
+
+    documentDeltas = [delta for delta in deltas if delta['side'] == journal.DOCUMENT]
+    libraryDeltas = [delta for delta in deltas if delta['side'] == journal.LIBRARY]
+
+    if documentDeltas:
+        if journalDocumentId(header) != currentDocumentId(header):
+            ui.messageBox(f'The synchronization changed the document \'{header["document_name"]}\'. Activate that document and retry the rollback.')
+            return
+        cam = adsk.cam.CAM.cast(app.activeProduct)
+        documentLibrary = cam.documentToolLibrary
+        touchedTools = rollbackDeltas(documentDeltas, header['match_parameter'], documentLibrary)
+        for tool in touchedTools: # document tools are updated one at a time, like when pulling
+            documentLibrary.update(tool, True)
+
+    if libraryDeltas:
+        camManager = adsk.cam.CAMManager.get()
+        toolLibraries = camManager.libraryManager.toolLibraries
+        library_url = adsk.core.URL.create(header['library_url'])
+        library = toolLibraries.toolLibraryAtURL(library_url)
+        rollbackDeltas(libraryDeltas, header['match_parameter'], library)
+        toolLibraries.updateToolLibrary(library_url, library) # library is updated all at once, like when pushing
+
+    # The merge baseline of the rolled back tools goes back to before the merge, so the next merge does not take the restored values for new edits
+    for delta in baselineDeltas:
+        baseline.restore_entries(delta['path'], header['library_url'], journalDocumentId(header), header['document_name'], header['match_parameter'], delta['tools'])
+        futil.log(f'Restored the merge baseline of {len(delta["tools"])} tools')
+
+    journal.mark_rolled_back(journal_path)
+    ui.messageBox('Rollback completed. See log for details')
+
+# This event handler is called when the command terminates.
+def command_destroy(args: adsk.core.CommandEventArgs):
+    futil.release_handlers(CMD_ID)
+    futil.log(f'>>> {CMD_NAME} Command Destroy Event')
+
+def journalDocumentId(header: Dict) -> str:
+    # Journals written before documents were identified by their data file only hold the name
+    return header.get('document_id', header['document_name'])
+
+def currentDocumentId(header: Dict) -> str:
+    if 'document_id' in header:
+        return shared_state.get_document_id(app.activeDocument)
+    return app.activeDocument.name
+
+def journaledToolKeys(header: Dict, deltas: List[Dict]) -> set:
+    ''' The tools changed by a journal, qualified by the library or document they belong to '''
+    keys = set()
+    for delta in deltas:
+        if delta['kind'] == journal.BASELINE:
+            continue
+        owner = header.get('library_url') if delta['side'] == journal.LIBRARY else journalDocumentId(header)
+        keys.add((delta['side'], owner, delta['tool']))
+    return keys
+
+def newerOverlappingJournals(header: Dict, deltas: List[Dict], newerJournals: List[str]) -> List[str]:
+    ''' Return the names of the newer journals that changed any of the tools of this journal '''
+    keys = journaledToolKeys(header, deltas)
+    overlapping = []
+    for path in newerJournals:
+        newerHeader, newerDeltas = journal.read_journal(path)
+        if keys & journaledToolKeys(newerHeader, newerDeltas):
+            overlapping.append(journal.format_journal_name(path))
+    return overlapping
+
+def findJournaledTool(matchParameter: str, library, delta: Dict, scannedTools: Dict):
+    ''' Return the index and tool a delta refers to, or None.
+
+    The tool at the journaled index is checked first. The whole library is read,
+    once, only when the tool has moved since the synchronization.
+    '''
+    try:
+        tool = library.item(delta['index'])
+        if tool and tool.parameters.itemByName(matchParameter).value.value == delta['tool']:
+            return delta['index'], tool
+    except:
+        pass # index out of range, or a journal written before indexes were recorded
+    if not scannedTools:
+        for index, tool in enumerate(library):
+            scannedTools.setdefault(tool.parameters.itemByName(matchParameter).value.value, (index, tool))
+    return scannedTools.get(delta['tool'])
+
+def rollbackDeltas(deltas: List[Dict], matchParameter: str, library) -> List:
+    ''' Apply the inverse of the deltas to the library, newest first. Returns the tools that were changed.
+
+    Values that changed again since the synchronization are skipped, so later edits are never overwritten.
+    '''
+    scannedTools = {}
+    touchedTools = {}
+    removedToolIndexes = []
+
+    for delta in reversed(deltas):
+        toolId = delta['tool']
+        found = findJournaledTool(matchParameter, library, delta, scannedTools)
+        if found is None:
+            futil.log(f'Rollback: no tool found for \'{toolId}\', skipped')
+            continue
+        index, tool = found
+        try:
+            match delta['kind']:
+                case journal.PARAMETER:
+                    parameter = tool.parameters.itemByName(delta['parameter'])
+                    if not valuesMatch(parameter.value.value, delta['new']):
+                        futil.log(f'Rollback: {toolId} \'{delta["parameter"]}\' changed since the synchronization ({parameter.value.value}), skipped')
+                        continue
+                    parameter.value.value = delta['old']
+                    futil.log(str(toolId) + ' \'' + delta['parameter'] + '\' ' + str(delta['new']) + ' -> ' + str(delta['old']))
+                    if delta['parameter'] == matchParameter and scannedTools: # older deltas refer to the tool by its previous value
+                        scannedTools.pop(toolId, None)
+                        scannedTools[delta['old']] = (index, tool)
+                case journal.PRESET_PARAMETER:
+                    preset = tool.presets.itemsByName(delta['preset'])[0]
+                    parameter = preset.parameters.itemByName(delta['parameter'])
+                    if not valuesMatch(parameter.value.value, delta['new']):
+                        futil.log(f'Rollback: {toolId} \'{delta["preset"]}\',\'{delta["parameter"]}\' changed since the synchronization ({parameter.value.value}), skipped')
+                        continue
+                    parameter.value.value = delta['old']
+                    futil.log(str(toolId) + ' \'' + delta['preset'] + '\',\'' + delta['parameter'] + '\' ' + str(delta['new']) + ' -> ' + str(delta['old']))
+                case journal.PRESET_ADDED:
+                    tool.presets.remove(tool.presets.itemsByName(delta['preset'])[0])
+                    futil.log('Preset \'' + delta['preset'] + '\' removed from ' + str(toolId))
+                case journal.TOOL_ADDED:
+                    removedToolIndexes.append(index)
+                    continue
+            touchedTools[toolId] = tool
+        except:
+            futil.log(f'Rollback: failed to undo {delta["kind"]} for \'{toolId}\'')
+
+    # Remove added tools last, from the back, so the indexes found above stay valid
+    for index in sorted(removedToolIndexes, reverse=True):
+        try:
+            library.remove(index)
+            futil.log(f'Removed tool at index {index} that was added by the synchronization')
+        except:
+            futil.log(f'Rollback: failed to remove the tool at index {index}, remove it manually')
+
+    return list(touchedTools.values())
@@ -25,9 +25,8 @@ ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource
 
 MODULE_PREFIX = f'{config.COMPANY_NAME}_{config.ADDIN_NAME}_'
 
-# Local list of event handlers used to maintain a reference so
-# they are not released and garbage collected.
-local_handlers = []
+# The handlers of each dialog are registered under CMD_ID
+# and released when the dialog is destroyed.
 
 running_commands = []
 current_commands = []
@@ -95,20 +94,32 @@ def command_created(args):
 
             for setting_key, setting_metadata in module_data["settings"].items():
                 if setting_metadata["type"] == "button" or setting_metadata["type"] == "checkbox":
-                    tabCmdInput.children.addBoolValueInput(setting_key, setting_metadata["label"], setting_metadata["type"] == "checkbox", "", setting_metadata["default"])
+                    bool_input = tabCmdInput.children.addBoolValueInput(setting_key, setting_metadata["label"], setting_metadata["type"] == "checkbox", "", setting_metadata["default"])
+                    if "tooltip" in setting_metadata:
+                        bool_input.tooltip = setting_metadata["tooltip"]
 
                 elif setting_metadata["type"] == "dropdown":
                     dropdown = tabCmdInput.children.addDropDownCommandInput(setting_key, setting_metadata["label"], adsk.core.DropDownStyles.TextListDropDownStyle)
                     for option in setting_metadata["options"]:
                         dropdown.listItems.add(option, option == setting_metadata["default"])
 
+                elif setting_metadata["type"] == "string":
+                    string_input = tabCmdInput.children.addStringValueInput(setting_key, setting_metadata["label"], setting_metadata["default"])
+                    if "tooltip" in setting_metadata:
+                        string_input.tooltip = setting_metadata["tooltip"]
+
                 # You can add support for more types as needed
 
-        futil.add_handler(args.command.inputChanged, input_changed_handler, local_handlers=local_handlers)
+        futil.add_handler(args.command.inputChanged, input_changed_handler, group=CMD_ID)
+        futil.add_handler(args.command.destroy, command_destroy, group=CMD_ID)
 
     except:
         ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
+# This event handler is called when the command terminates.
+def command_destroy(args: adsk.core.CommandEventArgs):
+    futil.release_handlers(CMD_ID)
+
 def input_changed_handler(args: adsk.core.InputChangedEventArgs):
     try:
         changed_input = args.input
@@ -130,6 +141,9 @@ def input_changed_handler(args: adsk.core.InputChangedEventArgs):
             if selected_item:
                 module_settings[setting_key]["default"] = selected_item.name
 
+        elif isinstance(changed_input, adsk.core.StringValueCommandInput):
+            module_settings[setting_key]["default"] = changed_input.value
+
         elif isinstance(changed_input, adsk.core.BoolValueCommandInput):
             module_settings[setting_key]["default"] = changed_input.value
             # check if it was a feature enablement setting
@@ -0,0 +1,56 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Dict
+from ... import shared_state
+
+# A baseline is the state of every matched tool after the last merge of a
+# library-document pair. Merging compares both sides against it, so only the
+# side that changed since the last sync is copied over.
+BASELINE_DIR = os.path.join(shared_state.settings_dir, 'baselines')
+
+if not os.path.exists(BASELINE_DIR):
+    os.makedirs(BASELINE_DIR)
+
+def baseline_path(library_url: str, document_id: str, match_parameter: str) -> str:
+    key = hashlib.sha1(f'{library_url}|{document_id}|{match_parameter}'.encode('utf-8')).hexdigest()
+    return os.path.join(BASELINE_DIR, f'{key}.json.gz')
+
+def load_baseline(path: str) -> Dict:
+    ''' Return the stored tools of a baseline keyed by match value, empty if the pair has never been merged '''
+    if not os.path.exists(path):
+        return {}
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            return json.load(file)['tools']
+    except (OSError, EOFError, ValueError, KeyError): # damaged baseline, merge as if it was the first time
+        return {}
+
+def save_baseline(path: str, library_url: str, document_id: str, document_name: str, match_parameter: str, tools: Dict):
+    baseline = {
+        'library_url': library_url,
+        'document_id': document_id,
+        'document_name': document_name,
+        'match_parameter': match_parameter,
+        'tools': tools
+    }
+    with gzip.open(path, 'wt', encoding='utf-8') as file:
+        json.dump(baseline, file, separators=(',', ':'), default=str)
+
+def restore_entries(path: str, library_url: str, document_id: str, document_name: str, match_parameter: str, entries: Dict):
+    ''' Put back the entries of some tools as they were before a merge. Tools without a previous entry are dropped, so they are compared as if never merged '''
+    tools = load_baseline(path)
+    for key, entry in entries.items():
+        if entry is None:
+            tools.pop(key, None)
+        else:
+            tools[key] = entry
+    save_baseline(path, library_url, document_id, document_name, match_parameter, tools)
+
+def fingerprint(tool) -> str:
+    ''' Hash of the whole tool taken with a single API call, used to skip tools that did not change '''
+    try:
+        return hashlib.sha1(tool.toJson().encode('utf-8')).hexdigest()
+    except:
+        return None
@@ -2,6 +2,11 @@ import adsk.core, adsk.fusion, adsk.cam, traceback
 import os
 from ...lib import fusion360utils as futil
 from ... import config
+from ... import journal
+from ... import shared_state
+from ... import library_catalog
+from ... import api_budget
+from . import baseline, merge, numbering
 from typing import List, Dict
 from adsk.cam import ToolLibrary, Tool, DocumentToolLibrary
 
@@ -19,9 +24,19 @@ COMMAND_BESIDE_ID = ''
 
 ICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', '')
 
-# Local list of event handlers used to maintain a reference so
-# they are not released and garbage collected.
-local_handlers = []
+NUMBERING_SETTINGS_ID = 'TOOL_NUMBERING'
+numbering_settings = {
+    "reserved_ranges": {
+        "type": "string",
+        "label": "Reserved Tool Number Ranges",
+        "tooltip": "Tool numbers used when renumbering duplicates, per tool type, e.g. drill: 100-199; flat end mill: 1-99; *: 1000-1999. Tools of other types are numbered in the * ranges, or outside all typed ranges.",
+        "default": ""
+    }
+}
+shared_state.load_settings_init(NUMBERING_SETTINGS_ID, "Tool Numbering", numbering_settings, ICON_FOLDER)
+
+# The execute and destroy handlers of each dialog are registered under CMD_ID
+# and released when the dialog is destroyed.
 
 def start():
     cmd_def = ui.commandDefinitions.addButtonDefinition(CMD_ID, CMD_NAME, CMD_Description, ICON_FOLDER)
@@ -47,8 +62,8 @@ def stop():
 def command_created(args: adsk.core.CommandCreatedEventArgs):
     # General logging for debug.
     futil.log(f'>>> {CMD_NAME} Command Created Event')
-    futil.add_handler(args.command.execute, command_execute, local_handlers=local_handlers)
-    futil.add_handler(args.command.destroy, command_destroy, local_handlers=local_handlers)
+    futil.add_handler(args.command.execute, command_execute, group=CMD_ID)
+    futil.add_handler(args.command.destroy, command_destroy, group=CMD_ID)
 
     inputs = args.command.commandInputs
 
@@ -75,6 +90,8 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     syncDirection_input = inputs.addDropDownCommandInput('syncDirection', 'Sync Direction', adsk.core.DropDownStyles.TextListDropDownStyle)
     syncDirection_input.listItems.add('Pull', True)
     syncDirection_input.listItems.add('Push', False)
+    syncDirection_input.listItems.add('Merge', False)
+    syncDirection_input.tooltipDescription = 'Merge copies only the values changed on one side since the last merge. Values changed on both sides are reported as conflicts.'
 
     # Skip Presets
     syncPresets_input = inputs.addBoolValueInput('syncPresets_input', 'Sync Preset Values', True, '', False)
@@ -83,8 +100,16 @@ def command_created(args: adsk.core.CommandCreatedEventArgs):
     diffOnly_input = inputs.addBoolValueInput('diffOnly_input', 'Log Differences Only ', True, '', False)
 
 def command_execute(args: adsk.core.CommandEventArgs):
+    # Counts the API calls of this run when config.API_BUDGET is set
+    api = api_budget.ApiCounter(CMD_NAME)
+    try:
+        synchronize(args, api)
+    finally:
+        api.log_summary()
+
+def synchronize(args: adsk.core.CommandEventArgs, api: api_budget.ApiCounter):
     # General logging for debug
-    cam = adsk.cam.CAM.cast(app.activeProduct)
+    cam = api.wrap(adsk.cam.CAM.cast(app.activeProduct))
     inputs = args.command.commandInputs
     match_input: adsk.core.DropDownCommandInput = inputs.itemById('match')
     match_type = match_input.selectedItem.name
@@ -97,8 +122,8 @@ def command_execute(args: adsk.core.CommandEventArgs):
     library_input: adsk.core.DropDownCommandInput = inputs.itemById('library')
     camManager = adsk.cam.CAMManager.get()
     libraryManager = camManager.libraryManager
-    toolLibraries = libraryManager.toolLibraries
-    libraries = get_tooling_libraries()
+    toolLibraries = api.wrap(libraryManager.toolLibraries)
+    libraries = get_tooling_libraries(api)
     formatted_libraries = format_library_names(libraries)
     library_index = formatted_libraries.index(library_input.selectedItem.name)
     library_url = adsk.core.URL.create(libraries[library_index])
@@ -119,6 +144,9 @@ def command_execute(args: adsk.core.CommandEventArgs):
     if syncDirection_type == 'Push':
         sourceLibrary = cam.documentToolLibrary
         targetLibrary = library
+    if syncDirection_type == 'Merge': # both sides are read and written, match values must be unique in both
+        sourceLibrary = library
+        targetLibrary = cam.documentToolLibrary
 
     # User verify that settings are correct
     buttonClicked = ui.messageBox(f'Synchronization will proceed with the following settings: \n\nMatch: {match_type} \nLibrary: {formatted_libraries[library_index]} \nDirection: {syncDirection_type} \nSync Preset Values: {syncPresets_mode} \nLog Differences Only: {diffOnly_mode} \n\nDue to API limitations, tool holder geometry cannot be updated.', "Verify Synchronization Settings.",1,2) #0 OK, -1 Error, 1 Cancel, 2 Yes or Retry, 3 No
@@ -129,80 +157,131 @@ def command_execute(args: adsk.core.CommandEventArgs):
         case 1:
             return
     
-    # Check if the source library has multiple instances of the match parameter. The command will not continue until the collisions are resolved.
-    # This is slow if the library is large
-    if hasCollisions(matchParameter, sourceLibrary):
-        ui.messageBox(f'Multiple tool instances with the same \'{match_type}\' were found in \'{formatted_libraries[library_index]}\'. There may only be one instance of each match before synchronization will continue. See log for details.')
-        return
-
-    for targetTool in targetLibrary:
-        matchValue = targetTool.parameters.itemByName(matchParameter).value.value # convenient to have as a shorter variable name
-
-        try:
-            sourceTool = [item for item in sourceLibrary if item.parameters.itemByName(matchParameter).value.value == matchValue][0] # Find SOURCE tool by parameter name, b/c iterating over target tools. Duplicates should be caught by hasCollisions()
-        except:
-            futil.log(f'No match found for \'{matchValue}\'')
-            if syncDirection_type == 'Pull': # If pulling data from a library, a user may want to add a dangling tool to the source library
-                buttonClicked = ui.messageBox(f'No match found for \'{matchValue}\' in Source Library. Add it to the Source Library?', "Add Tool to Source Library?",1,2) #0 OK, -1 Error, 1 Cancel, 2 Yes or Retry, 3 No
-                match buttonClicked:
-                    case 0:
-                        library.add(targetTool)
-                        toolLibraries.updateToolLibrary(library_url, library)
-                        futil.log(f'Added \'{matchValue}\' to Source Library')
-                    case 1:
-                        pass
-            continue
-
-        # Step 1/3 - Parameters
-        for toolParameter in sourceTool.parameters:
-            if True: #todo future for only syncing certain parameters
-                try: 
-                    writeDiffToLog(matchValue, toolParameter.name, targetTool.parameters.itemByName(toolParameter.name).value.value, sourceTool.parameters.itemByName(toolParameter.name).value.value)
-                    if not diffOnly_mode:
-                        targetTool.parameters.itemByName(toolParameter.name).value.value = sourceTool.parameters.itemByName(toolParameter.name).value.value
-                except Exception as error:
-                    # futil.log(error) # debug mode?
-                    futil.log('Failed to set \'' + toolParameter.name + '\' for ' + str(matchValue) + ' to ' + str(sourceTool.parameters.itemByName(toolParameter.name).value.value))
-                    pass
-
-        # Step 2/3 - Presets
-        if syncPresets_mode:
-            for sourceToolPreset in sourceTool.presets:
-                if not targetTool.presets.itemsByName(sourceToolPreset.name): # Add absent preset to target tool
-                    if not diffOnly_mode:
-                        newPreset = targetTool.presets.add()
-                        newPreset.name = sourceToolPreset.name
-                        for parameter in sourceToolPreset.parameters:
-                            newPreset.parameters.itemByName(parameter.name).value.value = sourceToolPreset.parameters.itemByName(parameter.name).value.value
-                    futil.log('Preset \'' + sourceToolPreset.name + '\' added to ' + str(matchValue))
-                else: # Overwrite existing preset
-                    targetToolPreset = [item for item in targetTool.presets if item.name == sourceToolPreset.name][0] # Find TARGET tool preset by name, b/c interating over source tool presets from the tool that was found earlier. UI disallows same names, so there should not be duplciates
-                    for parameter in sourceToolPreset.parameters:
-                        try:
-                            writeDiffToLog(matchValue, str(sourceToolPreset.name + '\',\'' + parameter.name), targetToolPreset.parameters.itemByName(parameter.name).value.value, sourceToolPreset.parameters.itemByName(parameter.name).value.value)
-                            if not diffOnly_mode:
-                                targetToolPreset.parameters.itemByName(parameter.name).value.value = sourceToolPreset.parameters.itemByName(parameter.name).value.value
-                        except:
-                            # futil.log(error) # debug mode?
-                            futil.log('Failed to set ' + str(sourceToolPreset.name + ' ' + parameter.name) + ' for ' + str(matchValue) + ' to ' + str(sourceToolPreset.parameters.itemByName(parameter.name).value.value))
-                            pass
+    # Every change is journaled so the run can be rolled back with the Rollback Sync command, renumbering included
+    targetSide = journal.DOCUMENT if syncDirection_type == 'Pull' else journal.LIBRARY
+    syncJournal = None
+    if not diffOnly_mode:
+        syncJournal = journal.SyncJournal(syncDirection_type, formatted_libraries[library_index], libraries[library_index], matchParameter, app.activeDocument.name, shared_state.get_document_id(app.activeDocument))
+
+    try:
+        # Check if the source library has multiple instances of the match parameter. The command will not continue until the collisions are resolved.
+        # This is slow if the library is large
+        # Duplicated tool numbers can be renumbered automatically
+        if hasCollisions(matchParameter, sourceLibrary) and not (matchParameter == 'tool_number' and resolveToolNumberCollisions(sourceLibrary, targetLibrary, syncDirection_type == 'Push', cam, toolLibraries, library_url, diffOnly_mode, syncJournal)):
+            ui.messageBox(f'Multiple tool instances with the same \'{match_type}\' were found in \'{formatted_libraries[library_index]}\'. There may only be one instance of each match before synchronization will continue. See log for details.')
+            return
+        if syncDirection_type == 'Merge' and hasCollisions(matchParameter, targetLibrary) and not (matchParameter == 'tool_number' and resolveToolNumberCollisions(targetLibrary, sourceLibrary, True, cam, toolLibraries, library_url, diffOnly_mode, syncJournal)):
+            ui.messageBox(f'Multiple tool instances with the same \'{match_type}\' were found in the document. There may only be one instance of each match before synchronization will continue. See log for details.')
+            return
 
-        # Step 3/3 Holder - API does not currently support editing the holder geometry
-        
-        if syncDirection_type == 'Pull': #update tools in doc one at a time when pulling
-            cam.documentToolLibrary.update(targetTool, True)
+        if syncDirection_type == 'Merge':
+            mergeWithBaseline(cam, toolLibraries, library, library_url, libraries[library_index], matchParameter, syncPresets_mode, diffOnly_mode, syncJournal)
+            return
 
-    if syncDirection_type == 'Push': #update library all at once at end when pushing
-        toolLibraries.updateToolLibrary(library_url, library)
+        for targetIndex, targetTool in enumerate(targetLibrary):
+            matchValue = targetTool.parameters.itemByName(matchParameter).value.value # convenient to have as a shorter variable name
+
+            try:
+                sourceTool = [item for item in sourceLibrary if item.parameters.itemByName(matchParameter).value.value == matchValue][0] # Find SOURCE tool by parameter name, b/c iterating over target tools. Duplicates should be caught by hasCollisions()
+            except:
+                futil.log(f'No match found for \'{matchValue}\'')
+                catalogLibraries = library_catalog.find_libraries(matchParameter, matchValue)
+                if catalogLibraries: # the tool may have been synced with the wrong library
+                    futil.log(f'\'{matchValue}\' exists in the watched libraries: {", ".join(catalogLibraries)}')
+                if syncDirection_type == 'Pull': # If pulling data from a library, a user may want to add a dangling tool to the source library
+                    buttonClicked = ui.messageBox(f'No match found for \'{matchValue}\' in Source Library. Add it to the Source Library?', "Add Tool to Source Library?",1,2) #0 OK, -1 Error, 1 Cancel, 2 Yes or Retry, 3 No
+                    match buttonClicked:
+                        case 0:
+                            library.add(targetTool)
+                            toolLibraries.updateToolLibrary(library_url, library)
+                            if syncJournal:
+                                syncJournal.record_tool_added(journal.LIBRARY, matchValue, library.count - 1) # added tools are appended
+                            futil.log(f'Added \'{matchValue}\' to Source Library')
+                        case 1:
+                            pass
+                continue
+
+            # Step 1/3 - Parameters
+            for toolParameter in sourceTool.parameters:
+                if True: #todo future for only syncing certain parameters
+                    try: 
+                        targetValue = targetTool.parameters.itemByName(toolParameter.name).value.value
+                        sourceValue = sourceTool.parameters.itemByName(toolParameter.name).value.value
+                        writeDiffToLog(matchValue, toolParameter.name, targetValue, sourceValue)
+                        if not diffOnly_mode:
+                            targetTool.parameters.itemByName(toolParameter.name).value.value = sourceValue
+                            if not merge.valuesMatch(targetValue, sourceValue): # same rounding as the diff log
+                                syncJournal.record_parameter(targetSide, matchValue, targetIndex, toolParameter.name, targetValue, sourceValue)
+                    except Exception as error:
+                        # futil.log(error) # debug mode?
+                        futil.log('Failed to set \'' + toolParameter.name + '\' for ' + str(matchValue) + ' to ' + str(sourceTool.parameters.itemByName(toolParameter.name).value.value))
+                        pass
+
+            # Step 2/3 - Presets
+            if syncPresets_mode:
+                for sourceToolPreset in sourceTool.presets:
+                    if not targetTool.presets.itemsByName(sourceToolPreset.name): # Add absent preset to target tool
+                        if not diffOnly_mode:
+                            newPreset = targetTool.presets.add()
+                            newPreset.name = sourceToolPreset.name
+                            for parameter in sourceToolPreset.parameters:
+                                newPreset.parameters.itemByName(parameter.name).value.value = sourceToolPreset.parameters.itemByName(parameter.name).value.value
+                            syncJournal.record_preset_added(targetSide, matchValue, targetIndex, sourceToolPreset.name)
+                        futil.log('Preset \'' + sourceToolPreset.name + '\' added to ' + str(matchValue))
+                    else: # Overwrite existing preset
+                        targetToolPreset = [item for item in targetTool.presets if item.name == sourceToolPreset.name][0] # Find TARGET tool preset by name, b/c interating over source tool presets from the tool that was found earlier. UI disallows same names, so there should not be duplciates
+                        for parameter in sourceToolPreset.parameters:
+                            try:
+                                targetValue = targetToolPreset.parameters.itemByName(parameter.name).value.value
+                                sourceValue = sourceToolPreset.parameters.itemByName(parameter.name).value.value
+                                writeDiffToLog(matchValue, str(sourceToolPreset.name + '\',\'' + parameter.name), targetValue, sourceValue)
+                                if not diffOnly_mode:
+                                    targetToolPreset.parameters.itemByName(parameter.name).value.value = sourceValue
+                                    if not merge.valuesMatch(targetValue, sourceValue):
+                                        syncJournal.record_preset_parameter(targetSide, matchValue, targetIndex, sourceToolPreset.name, parameter.name, targetValue, sourceValue)
+                            except:
+                                # futil.log(error) # debug mode?
+                                futil.log('Failed to set ' + str(sourceToolPreset.name + ' ' + parameter.name) + ' for ' + str(matchValue) + ' to ' + str(sourceToolPreset.parameters.itemByName(parameter.name).value.value))
+                                pass
+
+            # Step 3/3 Holder - API does not currently support editing the holder geometry
+            
+            if syncDirection_type == 'Pull': #update tools in doc one at a time when pulling
+                cam.documentToolLibrary.update(targetTool, True)
+
+        if syncDirection_type == 'Push': #update library all at once at end when pushing
+            toolLibraries.updateToolLibrary(library_url, library)
+    finally:
+        if syncJournal:
+            syncJournal.close()
 
     ui.messageBox('Synchronization completed. See log for details')
 
 # This event handler is called when the command terminates.
 def command_destroy(args: adsk.core.CommandEventArgs):
-    global local_handlers
-    local_handlers = []
+    futil.release_handlers(CMD_ID)
     futil.log(f'>>> {CMD_NAME} Command Destroy Event')
 
+def mergeWithBaseline(cam, toolLibraries, library, library_url, library_url_string, matchParameter, syncPresets_mode, diffOnly_mode, syncJournal):
+    documentId = shared_state.get_document_id(app.activeDocument)
+    baselinePath = baseline.baseline_path(library_url_string, documentId, matchParameter)
+    libraryChanged, conflicts, nextBaseline, touchedBaseline = merge.mergeLibraries(cam.documentToolLibrary, library, matchParameter, syncPresets_mode, diffOnly_mode, syncJournal, baselinePath)
+
+    if libraryChanged: #update library all at once at end, like when pushing
+        toolLibraries.updateToolLibrary(library_url, library)
+    if not diffOnly_mode:
+        baseline.save_baseline(baselinePath, library_url_string, documentId, app.activeDocument.name, matchParameter, nextBaseline)
+        if touchedBaseline: # a rollback restores them, otherwise the next merge copies the restored values over
+            syncJournal.record_baseline(baselinePath, touchedBaseline)
+
+    if conflicts:
+        futil.log(f'The following values were changed in both the document and the library and were not synchronized: <<<<<<<<<<')
+        for conflict in conflicts:
+            futil.log(conflict)
+        ui.messageBox(f'Merge completed with {len(conflicts)} conflicts that were left unchanged. Resolve them in the document or the library and merge again. See log for details.\n\nThe first merge of a library and document has no baseline, so every difference is reported as a conflict.')
+    else:
+        ui.messageBox('Merge completed. See log for details')
+
 def hasCollisions(parameterName, library):
     valueList = []
     counter = {}
@@ -223,6 +302,45 @@ def hasCollisions(parameterName, library):
             return True
     return False
 
+def resolveToolNumberCollisions(library, otherLibrary, isDocument: bool, cam, toolLibraries, library_url, diffOnly_mode: bool, syncJournal) -> bool:
+    ''' Offer to renumber the duplicated tool numbers of a library in one batch. Returns True when they were renumbered '''
+    try:
+        ranges = numbering.parse_ranges(shared_state.load_settings(NUMBERING_SETTINGS_ID)["reserved_ranges"]["default"])
+    except ValueError as error:
+        ui.messageBox(f'The reserved tool number ranges in the settings are invalid: {error}')
+        return False
+
+    tools = [(tool, tool.parameters.itemByName('tool_number').value.value, tool.parameters.itemByName('tool_type').value.value) for tool in library]
+    otherNumbers = [tool.parameters.itemByName('tool_number').value.value for tool in otherLibrary]
+    renumbering = numbering.propose_renumbering([(index, number, toolType) for index, (tool, number, toolType) in enumerate(tools)], otherNumbers, ranges)
+    if None in renumbering.values():
+        ui.messageBox('There are not enough free tool numbers in the reserved ranges to renumber the duplicates. See settings.')
+        return False
+
+    changes = [f'{tools[index][1]} ({tools[index][2]}) -> {number}' for index, number in renumbering.items()]
+    futil.log(f'Proposed renumbering of duplicated tool numbers: <<<<<<<<<<')
+    for change in changes:
+        futil.log(change)
+    if diffOnly_mode: # the proposal is only logged, like every other difference
+        return False
+    preview = '\n'.join(changes[:15]) + ('\n...' if len(changes) > 15 else '')
+    buttonClicked = ui.messageBox(f'{len(changes)} tools with a duplicated tool number can be renumbered: \n\n{preview}\n\nRenumber them and continue?', "Renumber Duplicated Tools?",1,2) #0 OK, -1 Error, 1 Cancel, 2 Yes or Retry, 3 No
+    if buttonClicked != 0:
+        return False
+
+    side = journal.DOCUMENT if isDocument else journal.LIBRARY
+    for index, number in renumbering.items():
+        tool, oldNumber, toolType = tools[index]
+        tool.parameters.itemByName('tool_number').value.value = number
+        if syncJournal:
+            syncJournal.record_parameter(side, number, index, 'tool_number', oldNumber, number)
+        if isDocument: # document tools are updated one at a time
+            cam.documentToolLibrary.update(tool, True)
+    if not isDocument:
+        toolLibraries.updateToolLibrary(library_url, library)
+    futil.log(f'Renumbered {len(changes)} tools')
+    return True
+
 def writeDiffToLog(id, parameterName, targetValue, sourceValue):
     try: # float errors make logging diffs sensitive
         sourceValue = round(sourceValue,4)
@@ -233,11 +351,11 @@ def writeDiffToLog(id, parameterName, targetValue, sourceValue):
         futil.log(str(id) + ' \'' + str(parameterName) + '\' ' + str(targetValue) + ' -> ' + str(sourceValue))
     return
 
-def get_tooling_libraries() -> List:
+def get_tooling_libraries(api: api_budget.ApiCounter = None) -> List:
     # Get the list of tooling libraries
     camManager = adsk.cam.CAMManager.get()
     libraryManager = camManager.libraryManager
-    toolLibraries = libraryManager.toolLibraries
+    toolLibraries = api.wrap(libraryManager.toolLibraries) if api else libraryManager.toolLibraries
     fusion360Folder = toolLibraries.urlByLocation(adsk.cam.LibraryLocations.CloudLibraryLocation)
     libraries = getLibrariesURLs(toolLibraries, fusion360Folder)
     fusion360Folder = toolLibraries.urlByLocation(adsk.cam.LibraryLocations.LocalLibraryLocation)
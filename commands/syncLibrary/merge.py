@@ -0,0 +1,202 @@
+from ...lib import fusion360utils as futil
+from ... import journal
+from ... import library_catalog
+from . import baseline
+from typing import List, Dict, Tuple
+
+# Marks a parameter or preset that does not exist on one side or in the baseline
+MISSING = object()
+
+def valuesMatch(a, b) -> bool:
+    if a is MISSING or b is MISSING:
+        return a is b
+    try: # float errors make comparisons sensitive, same rounding as the diff log
+        a = round(a,4)
+        b = round(b,4)
+    except:
+        pass # value isn't a number
+    return str(a) == str(b)
+
+def indexTools(library, matchParameter: str) -> Dict:
+    ''' Return the tools of a library and their index keyed by their match value, reading only the match parameter of each tool '''
+    tools = {}
+    for index, tool in enumerate(library):
+        tools[tool.parameters.itemByName(matchParameter).value.value] = (index, tool)
+    return tools
+
+def readToolValues(tool, syncPresets_mode: bool) -> Dict:
+    values = {'parameters': {}, 'presets': {}}
+    for parameter in tool.parameters:
+        try:
+            values['parameters'][parameter.name] = parameter.value.value
+        except:
+            pass # parameter without a readable value
+    if syncPresets_mode:
+        for preset in tool.presets:
+            values['presets'][preset.name] = {}
+            for parameter in preset.parameters:
+                try:
+                    values['presets'][preset.name][parameter.name] = parameter.value.value
+                except:
+                    pass
+    return values
+
+def mergeValues(baseValues: Dict, documentValues: Dict, libraryValues: Dict) -> Tuple[Dict, Dict, List[str], Dict]:
+    ''' Three-way merge of two sets of parameter values against their baseline.
+
+    Returns the values to write to the document, the values to write to the
+    library, the names of the conflicting parameters and the merged values to
+    store as the next baseline. Parameters that only exist on one side are left alone.
+    '''
+    toDocument = {}
+    toLibrary = {}
+    conflicts = []
+    merged = {}
+    for name, documentValue in documentValues.items():
+        if name not in libraryValues:
+            continue
+        libraryValue = libraryValues[name]
+        baseValue = baseValues.get(name, MISSING)
+        if valuesMatch(documentValue, libraryValue):
+            merged[name] = documentValue
+        elif valuesMatch(documentValue, baseValue): # only the library changed
+            toDocument[name] = libraryValue
+            merged[name] = libraryValue
+        elif valuesMatch(libraryValue, baseValue): # only the document changed
+            toLibrary[name] = documentValue
+            merged[name] = documentValue
+        else: # both changed, keep the baseline so it is reported again until resolved
+            conflicts.append(name)
+            if baseValue is not MISSING:
+                merged[name] = baseValue
+    return toDocument, toLibrary, conflicts, merged
+
+def mergeLibraries(documentLibrary, library, matchParameter: str, syncPresets_mode: bool, diffOnly_mode: bool, syncJournal, baselinePath: str) -> Tuple[bool, List[str], Dict, Dict]:
+    ''' Bidirectional sync of the document and a library using the baseline of the last merge.
+
+    Document tools are updated one at a time, the caller updates the library once
+    when the returned flag is set. Returns that flag, the conflicts for review,
+    the tools to store as the next baseline and the previous baseline of the
+    tools that were written, None for tools that had none.
+    '''
+    storedTools = baseline.load_baseline(baselinePath)
+    libraryTools = indexTools(library, matchParameter)
+    nextBaseline = {}
+    touchedBaseline = {}
+    conflicts = []
+    libraryChanged = False
+    skipped = 0
+
+    for matchValue, (documentIndex, documentTool) in indexTools(documentLibrary, matchParameter).items():
+        if matchValue not in libraryTools:
+            futil.log(f'No match found for \'{matchValue}\'')
+            catalogLibraries = library_catalog.find_libraries(matchParameter, matchValue)
+            if catalogLibraries:
+                futil.log(f'\'{matchValue}\' exists in the watched libraries: {", ".join(catalogLibraries)}')
+            continue
+        libraryIndex, libraryTool = libraryTools[matchValue]
+
+        key = str(matchValue)
+        previous = storedTools.get(key)
+        documentPrint = baseline.fingerprint(documentTool)
+        libraryPrint = baseline.fingerprint(libraryTool)
+        # A baseline taken without presets cannot tell whether the presets are in sync
+        presetsCovered = previous and (previous.get('presets') or not syncPresets_mode)
+        if presetsCovered and documentPrint and previous['document'] == documentPrint and previous['library'] == libraryPrint:
+            # Neither side changed since the last merge, no need to read any parameter
+            nextBaseline[key] = previous
+            skipped += 1
+            continue
+
+        baseValues = previous['values'] if previous else {'parameters': {}, 'presets': {}}
+        documentValues = readToolValues(documentTool, syncPresets_mode)
+        libraryValues = readToolValues(libraryTool, syncPresets_mode)
+        mergedValues = {'parameters': {}, 'presets': {}}
+        toolConflicts = []
+        documentChanged = False
+        toolLibraryChanged = False
+
+        # Step 1/2 - Parameters
+        toDocument, toLibrary, parameterConflicts, mergedValues['parameters'] = mergeValues(baseValues['parameters'], documentValues['parameters'], libraryValues['parameters'])
+        documentChanged |= applyValues(documentTool, toDocument, documentValues['parameters'], matchValue, documentIndex, journal.DOCUMENT, diffOnly_mode, syncJournal)
+        toolLibraryChanged |= applyValues(libraryTool, toLibrary, libraryValues['parameters'], matchValue, libraryIndex, journal.LIBRARY, diffOnly_mode, syncJournal)
+        for name in parameterConflicts:
+            toolConflicts.append(f'{matchValue} \'{name}\' document: {documentValues["parameters"][name]} library: {libraryValues["parameters"][name]} baseline: {baseValues["parameters"].get(name)}')
+
+        # Step 2/2 - Presets
+        if syncPresets_mode:
+            for presetName in list(documentValues['presets']) + [name for name in libraryValues['presets'] if name not in documentValues['presets']]:
+                basePreset = baseValues['presets'].get(presetName)
+                documentPreset = documentValues['presets'].get(presetName)
+                libraryPreset = libraryValues['presets'].get(presetName)
+                if documentPreset is not None and libraryPreset is not None:
+                    toDocument, toLibrary, presetConflicts, mergedValues['presets'][presetName] = mergeValues(basePreset or {}, documentPreset, libraryPreset)
+                    if toDocument:
+                        documentChanged |= applyValues(documentTool.presets.itemsByName(presetName)[0], toDocument, documentPreset, matchValue, documentIndex, journal.DOCUMENT, diffOnly_mode, syncJournal, presetName)
+                    if toLibrary:
+                        toolLibraryChanged |= applyValues(libraryTool.presets.itemsByName(presetName)[0], toLibrary, libraryPreset, matchValue, libraryIndex, journal.LIBRARY, diffOnly_mode, syncJournal, presetName)
+                    for name in presetConflicts:
+                        toolConflicts.append(f'{matchValue} \'{presetName}\',\'{name}\' document: {documentPreset[name]} library: {libraryPreset[name]} baseline: {(basePreset or {}).get(name)}')
+                elif basePreset is not None: # deleted on one side since the last merge, presets are never deleted automatically
+                    mergedValues['presets'][presetName] = basePreset # keep reporting it until resolved
+                    toolConflicts.append(f'{matchValue} preset \'{presetName}\' was removed from the {"library" if documentPreset is not None else "document"}')
+                elif documentPreset is not None: # new in the document
+                    toolLibraryChanged |= addPreset(documentTool, libraryTool, presetName, matchValue, libraryIndex, journal.LIBRARY, diffOnly_mode, syncJournal)
+                    mergedValues['presets'][presetName] = documentPreset
+                else: # new in the library
+                    documentChanged |= addPreset(libraryTool, documentTool, presetName, matchValue, documentIndex, journal.DOCUMENT, diffOnly_mode, syncJournal)
+                    mergedValues['presets'][presetName] = libraryPreset
+        else: # presets were not compared, keep their baseline for the next merge that does
+            mergedValues['presets'] = baseValues['presets']
+
+        if documentChanged:
+            documentLibrary.update(documentTool, True)
+        libraryChanged |= toolLibraryChanged
+        if documentChanged or toolLibraryChanged:
+            touchedBaseline[key] = previous
+
+        conflicts += toolConflicts
+        nextBaseline[key] = {
+            # A tool with conflicts keeps no fingerprints so it is compared again on the next merge
+            'document': None if toolConflicts else baseline.fingerprint(documentTool),
+            'library': None if toolConflicts else baseline.fingerprint(libraryTool),
+            'presets': syncPresets_mode,
+            'values': mergedValues
+        }
+
+    futil.log(f'Merge skipped {skipped} tools unchanged on both sides since the last merge')
+    return libraryChanged, conflicts, nextBaseline, touchedBaseline
+
+def applyValues(target, values: Dict, oldValues: Dict, matchValue, toolIndex: int, side: str, diffOnly_mode: bool, syncJournal, presetName: str = None) -> bool:
+    ''' Write the merged values to a tool or preset. Returns True if anything was written '''
+    changed = False
+    for name, value in values.items():
+        label = name if presetName is None else presetName + '\',\'' + name
+        futil.log(str(matchValue) + ' \'' + label + '\' ' + str(oldValues[name]) + ' -> ' + str(value) + ' (' + side + ')')
+        if diffOnly_mode:
+            continue
+        try:
+            target.parameters.itemByName(name).value.value = value
+            changed = True
+            if presetName is None:
+                syncJournal.record_parameter(side, matchValue, toolIndex, name, oldValues[name], value)
+            else:
+                syncJournal.record_preset_parameter(side, matchValue, toolIndex, presetName, name, oldValues[name], value)
+        except:
+            futil.log('Failed to set \'' + label + '\' for ' + str(matchValue) + ' to ' + str(value))
+    return changed
+
+def addPreset(sourceTool, targetTool, presetName: str, matchValue, toolIndex: int, side: str, diffOnly_mode: bool, syncJournal) -> bool:
+    futil.log('Preset \'' + presetName + '\' added to ' + str(matchValue) + ' (' + side + ')')
+    if diffOnly_mode:
+        return False
+    sourcePreset = sourceTool.presets.itemsByName(presetName)[0]
+    newPreset = targetTool.presets.add()
+    newPreset.name = presetName
+    for parameter in sourcePreset.parameters:
+        try:
+            newPreset.parameters.itemByName(parameter.name).value.value = parameter.value.value
+        except:
+            futil.log('Failed to set ' + presetName + ' ' + parameter.name + ' for ' + str(matchValue) + ' to ' + str(parameter.value.value))
+    syncJournal.record_preset_added(side, matchValue, toolIndex, presetName)
+    return True
@@ -0,0 +1,117 @@
+import re
+from typing import List, Dict, Tuple, Iterable
+
+# Tool numbers are kept in a bitset split into blocks of BLOCK_BITS numbers
+# (a python int per block, bit n set when tool number n is used), so adding a
+# number or finding the lowest free number in a range only touches a few small
+# integers instead of scanning every tool.
+MAX_TOOL_NUMBER = 99999
+DEFAULT_RANGE = '*'
+BLOCK_BITS = 4096
+
+class NumberIndex:
+    def __init__(self, numbers: Iterable[int] = ()):
+        self.blocks = {}
+        for number in numbers:
+            self.add(number)
+
+    def add(self, number: int):
+        if isinstance(number, int) and number >= 0:
+            block = number // BLOCK_BITS
+            self.blocks[block] = self.blocks.get(block, 0) | (1 << (number % BLOCK_BITS))
+
+    def add_range(self, start: int, end: int):
+        for block in range(start // BLOCK_BITS, end // BLOCK_BITS + 1):
+            low = max(start, block * BLOCK_BITS) - block * BLOCK_BITS
+            high = min(end, block * BLOCK_BITS + BLOCK_BITS - 1) - block * BLOCK_BITS
+            self.blocks[block] = self.blocks.get(block, 0) | (((1 << (high - low + 1)) - 1) << low)
+
+    def __contains__(self, number: int) -> bool:
+        return isinstance(number, int) and number >= 0 and (self.blocks.get(number // BLOCK_BITS, 0) >> (number % BLOCK_BITS)) & 1 == 1
+
+    def lowest_free(self, start: int, end: int, reserved: 'NumberIndex' = None) -> int:
+        ''' Return the lowest number in [start, end] that is neither used nor reserved, None if the range is full '''
+        for block in range(start // BLOCK_BITS, end // BLOCK_BITS + 1):
+            base = block * BLOCK_BITS
+            taken = self.blocks.get(block, 0)
+            if reserved:
+                taken |= reserved.blocks.get(block, 0)
+            low = max(start, base) - base
+            high = min(end, base + BLOCK_BITS - 1) - base
+            free = ~taken & (((1 << (high - low + 1)) - 1) << low)
+            if free:
+                return base + (free & -free).bit_length() - 1
+        return None
+
+def parse_ranges(text: str) -> List[Tuple[str, int, int]]:
+    ''' Parse reserved ranges like "drill: 100-199, 300-399; flat end mill: 1-99; *: 1000-1999".
+
+    Keys are tool types (the tool_type parameter, case insensitive). Tools of a
+    type with ranges are only numbered inside them, other tools are numbered
+    inside the * ranges, or anywhere outside the typed ranges when there are none.
+    '''
+    ranges = []
+    for entry in text.split(';'):
+        if not entry.strip():
+            continue
+        if ':' not in entry:
+            raise ValueError(f'\'{entry.strip()}\' is missing the tool type, e.g. \'drill: 100-199\'')
+        key, numbers = entry.split(':', 1)
+        for numberRange in numbers.split(','):
+            match = re.fullmatch(r'\s*(\d+)\s*-\s*(\d+)\s*', numberRange)
+            if not match or int(match.group(1)) > int(match.group(2)):
+                raise ValueError(f'\'{numberRange.strip()}\' is not a range of tool numbers, e.g. \'100-199\'')
+            ranges.append((key.strip().lower(), int(match.group(1)), int(match.group(2))))
+    return ranges
+
+def propose_renumbering(tools: List[Tuple[object, int, str]], otherNumbers: Iterable[int], ranges: List[Tuple[str, int, int]]) -> Dict[object, int]:
+    ''' Propose new numbers for the duplicated tool numbers of a library.
+
+    tools holds (key, tool number, tool type) for each tool of the library. The
+    first tool with a number keeps it, only the later duplicates are renumbered, to
+    the lowest number that is unused in the library and in otherNumbers and allowed
+    for their tool type. Returns the new number by key, None when no number is free.
+    '''
+    seen = set()
+    duplicates = []
+    for key, number, toolType in tools:
+        if number in seen:
+            duplicates.append((key, toolType))
+        seen.add(number)
+
+    used = NumberIndex(seen)
+    for number in otherNumbers:
+        used.add(number)
+
+    typedRanges = {}
+    defaultRanges = []
+    typedNumbers = NumberIndex()
+    for rangeKey, start, end in ranges:
+        if rangeKey == DEFAULT_RANGE:
+            defaultRanges.append((start, end))
+        else:
+            typedRanges.setdefault(rangeKey, []).append((start, end))
+            typedNumbers.add_range(start, end)
+    if not defaultRanges:
+        defaultRanges = [(1, MAX_TOOL_NUMBER)]
+
+    # Numbers are only ever added, so the next free number of a range is never below the last one found
+    cursors = {}
+    renumbering = {}
+    for key, toolType in duplicates:
+        toolType = str(toolType).lower()
+        if toolType in typedRanges:
+            candidates, reserved = typedRanges[toolType], None
+        else: # numbers reserved for other tool types are off limits
+            candidates, reserved = defaultRanges, typedNumbers
+        renumbering[key] = None
+        for start, end in candidates:
+            cursor = (start, end, reserved is None)
+            number = used.lowest_free(cursors.get(cursor, start), end, reserved)
+            if number is not None:
+                renumbering[key] = number
+                used.add(number)
+                cursors[cursor] = number + 1
+                break
+            cursors[cursor] = end + 1
+    return renumbering
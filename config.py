@@ -10,6 +10,16 @@ import os
 # are ready to distribute it.
 DEBUG = True
 
+# Flag that indicates to count the calls into the adsk API made by the commands
+# and write a per-run summary to the Text Command window. Useful when looking
+# for the cause of a slow sync, leave it False otherwise.
+API_BUDGET = False
+
+# Flag that indicates to log event handlers that take long and the live handlers
+# of each command when its handlers are released. Handler times include waiting
+# on message boxes, so leave it False unless looking for a slow or leaking handler.
+HANDLER_DIAGNOSTICS = False
+
 # Gets the name of the add-in from the name of the folder the py file is in.
 # This is used when defining unique internal names for various UI elements 
 # that need a unique name. It's also recommended to use a company name as 
@@ -0,0 +1,121 @@
+import gzip
+import json
+import os
+import time
+from typing import List, Dict, Tuple
+from . import shared_state
+
+# Every sync run writes a gzip-compressed, append-only journal holding only the
+# values it changed. Rolling back replays the journal backwards, writing the old
+# values, so the cost follows the number of changes instead of the library size.
+JOURNAL_DIR = os.path.join(shared_state.settings_dir, 'journals')
+JOURNAL_EXT = '.jsonl.gz'
+ROLLED_BACK_EXT = '.rolledback' + JOURNAL_EXT
+
+# Sides a delta can be applied to
+DOCUMENT = 'document'
+LIBRARY = 'library'
+
+# Kinds of deltas
+PARAMETER = 'parameter'
+PRESET_PARAMETER = 'preset_parameter'
+PRESET_ADDED = 'preset_added'
+TOOL_ADDED = 'tool_added'
+BASELINE = 'baseline' # merge baseline entries to restore, not a change of any tool
+
+if not os.path.exists(JOURNAL_DIR):
+    os.makedirs(JOURNAL_DIR)
+
+def _json_value(value):
+    # adsk values are plain python types, anything else is stored as text
+    return str(value)
+
+class SyncJournal:
+    def __init__(self, direction: str, library_name: str, library_url: str, match_parameter: str, document_name: str, document_id: str):
+        timestamp = time.strftime('%Y%m%d-%H%M%S')
+        self.path = os.path.join(JOURNAL_DIR, f'{timestamp}_{direction}{JOURNAL_EXT}')
+        self.changes = 0
+        self.file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self._write({
+            'kind': 'header',
+            'time': timestamp,
+            'direction': direction,
+            'library_name': library_name,
+            'library_url': library_url,
+            'match_parameter': match_parameter,
+            'document_name': document_name,
+            'document_id': document_id
+        })
+
+    def _write(self, entry: Dict):
+        self.file.write(json.dumps(entry, separators=(',', ':'), default=_json_value) + '\n')
+
+    # tool_id is the match value of the tool after the change, tool_index its position
+    # in the library so a rollback can find it without reading the whole library.
+
+    def record_parameter(self, side: str, tool_id, tool_index: int, parameter_name: str, old_value, new_value):
+        self.changes += 1
+        self._write({'kind': PARAMETER, 'side': side, 'tool': tool_id, 'index': tool_index, 'parameter': parameter_name, 'old': old_value, 'new': new_value})
+
+    def record_preset_parameter(self, side: str, tool_id, tool_index: int, preset_name: str, parameter_name: str, old_value, new_value):
+        self.changes += 1
+        self._write({'kind': PRESET_PARAMETER, 'side': side, 'tool': tool_id, 'index': tool_index, 'preset': preset_name, 'parameter': parameter_name, 'old': old_value, 'new': new_value})
+
+    def record_preset_added(self, side: str, tool_id, tool_index: int, preset_name: str):
+        self.changes += 1
+        self._write({'kind': PRESET_ADDED, 'side': side, 'tool': tool_id, 'index': tool_index, 'preset': preset_name})
+
+    def record_tool_added(self, side: str, tool_id, tool_index: int):
+        self.changes += 1
+        self._write({'kind': TOOL_ADDED, 'side': side, 'tool': tool_id, 'index': tool_index})
+
+    def record_baseline(self, baseline_path: str, tools: Dict):
+        self._write({'kind': BASELINE, 'path': baseline_path, 'tools': tools})
+
+    def close(self):
+        ''' Close the journal. A journal without any changes is removed since there is nothing to roll back '''
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if self.changes == 0:
+            os.remove(self.path)
+
+def list_journals() -> List[str]:
+    ''' Return the journals that have not been rolled back yet, newest first.
+
+    Journals without a header, e.g. of a sync that crashed before anything was flushed, cannot be rolled back and are left out.
+    '''
+    journals = [os.path.join(JOURNAL_DIR, name) for name in os.listdir(JOURNAL_DIR) if name.endswith(JOURNAL_EXT) and not name.endswith(ROLLED_BACK_EXT)]
+    return sorted([path for path in journals if read_header(path)], reverse=True)
+
+def read_header(path: str) -> Dict:
+    ''' Return the header of a journal, empty if it has none '''
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            entry = json.loads(file.readline())
+    except (OSError, EOFError, ValueError):
+        return {}
+    return entry if entry.get('kind') == 'header' else {}
+
+def read_journal(path: str) -> Tuple[Dict, List[Dict]]:
+    ''' Return the header and the list of deltas of a journal '''
+    header = {}
+    deltas = []
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        try:
+            for line in file:
+                entry = json.loads(line)
+                if entry['kind'] == 'header':
+                    header = entry
+                else:
+                    deltas.append(entry)
+        except (EOFError, json.JSONDecodeError): # journal of a sync that did not finish, keep what was written
+            pass
+    return header, deltas
+
+def mark_rolled_back(path: str):
+    os.rename(path, path[:-len(JOURNAL_EXT)] + ROLLED_BACK_EXT)
+
+def format_journal_name(path: str) -> str:
+    return os.path.basename(path)[:-len(JOURNAL_EXT)]
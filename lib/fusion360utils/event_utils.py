@@ -10,22 +10,44 @@
 #  UNINTERRUPTED OR ERROR FREE.
 
 import sys
+import time
 from typing import Callable
 
 import adsk.core
-from .general_utils import handle_error
+from .general_utils import handle_error, log
 
+# Attempt to read HANDLER_DIAGNOSTICS flag from parent config.
+try:
+    from ... import config
+    HANDLER_DIAGNOSTICS = config.HANDLER_DIAGNOSTICS
+except:
+    HANDLER_DIAGNOSTICS = False
 
 # Global Variable to hold Event Handlers
 _handlers = []
 
+# Handler types resolved per event class and handler classes defined per
+# (handler type, callback, name), so registering a handler again reuses them.
+_handler_types = {}
+_handler_classes = {}
+
+# Live handlers registered with a group, usually a command id, as (event, handler) pairs.
+_registry = {}
+
+# Functions called with (name, seconds) after every event dispatch.
+_dispatch_hooks = []
+
+# Handlers taking longer than this many seconds are logged when HANDLER_DIAGNOSTICS is set.
+SLOW_HANDLER_SECONDS = 0.5
+
 
 def add_handler(
         event: adsk.core.Event,
         callback: Callable,
         *,
         name: str = None,
-        local_handlers: list = None
+        local_handlers: list = None,
+        group: str = None
 ):
     """Adds an event handler to the specified event.
 
@@ -42,22 +64,70 @@ def add_handler(
                       be cleared using the clear_handlers function. You may want
                       to maintain your own handler list so it can be managed 
                       independently for each command.
+    group -- A name, usually the command id, to register the handler under.
+             Handlers of a group are counted by live_handlers and released
+             together by release_handlers. This argument must be specified
+             by its keyword.
 
     :returns:
         The event handler that was created.  You don't often need this reference, but it can be useful in some cases.
     """   
-    module = sys.modules[event.__module__]
-    handler_type = module.__dict__[event.add.__annotations__['handler']]
-    handler = _create_handler(handler_type, callback, event, name, local_handlers)
+    handler_type = _handler_type(event)
+    handler = _create_handler(handler_type, callback, event, name, local_handlers, group)
     event.add(handler)
     return handler
 
 
 def clear_handlers():
-    """Clears the global list of handlers.
+    """Clears the global list of handlers and the handlers of every group.
     """
     global _handlers
     _handlers = []
+    for group in list(_registry):
+        release_handlers(group)
+
+
+def release_handlers(group: str):
+    """Removes the handlers of a group from their events and releases them.
+
+    Arguments:
+    group -- The name the handlers were registered under.
+    """
+    released = _registry.pop(group, [])
+    for event, handler in released:
+        try:
+            event.remove(handler)
+        except:
+            pass # the event is already gone with its command
+    if HANDLER_DIAGNOSTICS:
+        log(f'Released {len(released)} handlers of \'{group}\', live handlers: {live_handlers()}')
+
+
+def live_handlers() -> dict:
+    """Returns the number of live handlers of each group.
+    """
+    return {group: len(handlers) for group, handlers in _registry.items()}
+
+
+def add_dispatch_hook(hook: Callable):
+    """Adds a function called with the handler name and the seconds it took after every event dispatch.
+    """
+    _dispatch_hooks.append(hook)
+
+
+def remove_dispatch_hook(hook: Callable):
+    if hook in _dispatch_hooks:
+        _dispatch_hooks.remove(hook)
+
+
+def _handler_type(event: adsk.core.Event):
+    event_class = type(event)
+    handler_type = _handler_types.get(event_class)
+    if handler_type is None:
+        module = sys.modules[event.__module__]
+        handler_type = module.__dict__[event.add.__annotations__['handler']]
+        _handler_types[event_class] = handler_type
+    return handler_type
 
 
 def _create_handler(
@@ -65,24 +135,47 @@ def _create_handler(
         callback: Callable,
         event: adsk.core.Event,
         name: str = None,
-        local_handlers: list = None
+        local_handlers: list = None,
+        group: str = None
 ):
     handler = _define_handler(handler_type, callback, name)()
-    (local_handlers if local_handlers is not None else _handlers).append(handler)
+    if group is not None:
+        _registry.setdefault(group, []).append((event, handler))
+    else:
+        (local_handlers if local_handlers is not None else _handlers).append(handler)
     return handler
 
 
+def _log_slow_handler(name: str, seconds: float):
+    if seconds > SLOW_HANDLER_SECONDS:
+        log(f'Slow event handler \'{name}\': {seconds:.3f} seconds')
+
+
 def _define_handler(handler_type, callback, name: str = None):
+    key = (handler_type, callback, name)
+    if key in _handler_classes:
+        return _handler_classes[key]
     name = name or handler_type.__name__
+    label = f'{name} {getattr(callback, "__name__", "")}'.strip()
 
     class Handler(handler_type):
         def __init__(self):
             super().__init__()
 
         def notify(self, args):
+            start = time.perf_counter()
             try:
                 callback(args)
             except:
                 handle_error(name)
-
+            seconds = time.perf_counter() - start
+            if HANDLER_DIAGNOSTICS:
+                _log_slow_handler(label, seconds)
+            for hook in _dispatch_hooks:
+                try:
+                    hook(label, seconds)
+                except:
+                    handle_error(f'{label} dispatch hook')
+
+    _handler_classes[key] = Handler
     return Handler
@@ -0,0 +1,296 @@
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import platform
+import select
+import struct
+import threading
+import time
+from typing import List, Dict
+from .lib import fusion360utils as futil
+
+# In-memory catalog of the tool library files behind the local and external
+# library locations. A background watcher re-parses only the files that change,
+# so the catalog and its search index stay current without rebuilding anything
+# when a command is opened. The watcher thread never calls the Fusion API, it
+# only reads files.
+#
+# The catalog is only used to point out which watched library holds a tool that
+# has no match during a sync, so watching is off unless enabled in the settings.
+
+LOCAL = 'local'
+EXTERNAL = 'external'
+
+LIBRARY_EXTENSIONS = ('.json',)
+DEBOUNCE_SECONDS = 1.0 # wait for a file to be quiet this long before re-parsing it
+POLL_SECONDS = 2.0 # interval of the polling watcher
+MAX_WATCHED_DIRECTORIES = 256 # bounds the watching cost of large folder trees
+MAX_WATCHED_FILES = 5000
+
+# Catalog fields holding the value of the tool parameters the sync matches on
+PARAMETER_FIELDS = {
+    'tool_number': 'number',
+    'tool_comment': 'comment',
+    'tool_productId': 'product_id',
+    'tool_description': 'description'
+}
+
+def default_local_library_folder() -> str:
+    user_home = os.path.expanduser("~")
+    if platform.system() == "Windows":
+        return os.path.join(user_home, 'AppData', 'Roaming', 'Autodesk', 'CAM360', 'libraries', 'Local')
+    elif platform.system() == "Darwin":
+        return os.path.join(user_home, 'Library', 'Application Support', 'Autodesk', 'CAM360', 'libraries', 'Local')
+    else:
+        return os.path.join(user_home, '.Autodesk', 'CAM360', 'libraries', 'Local')
+
+def parse_library_file(path: str) -> Dict:
+    ''' Read a tool library file into a catalog entry holding its fingerprint and a summary of each tool '''
+    with open(path, 'rb') as file:
+        content = file.read()
+    entry = {
+        'path': path,
+        'name': os.path.splitext(os.path.basename(path))[0],
+        'fingerprint': hashlib.sha1(content).hexdigest(),
+        'tools': []
+    }
+    try:
+        data = json.loads(content)
+    except ValueError: # not a tool library, or a file that is still being written
+        return entry
+    for tool in data.get('data', []) if isinstance(data, dict) else []:
+        postProcess = tool.get('post-process', {})
+        entry['tools'].append({
+            'number': postProcess.get('number'),
+            'comment': postProcess.get('comment', ''),
+            'description': tool.get('description', ''),
+            'product_id': tool.get('product-id', ''),
+            'type': tool.get('type', ''),
+            'presets': len(tool.get('start-values', {}).get('presets', []))
+        })
+    return entry
+
+def _tokens(tool: Dict) -> set:
+    text = ' '.join(str(tool[key]) for key in ('number', 'comment', 'description', 'product_id', 'type') if tool[key] is not None)
+    return set(text.lower().split())
+
+class LibraryCatalog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.libraries = {} # path -> catalog entry
+        self.locations = {} # path -> location
+        self.index = {} # token -> set of (path, tool index)
+        self.errors = []
+
+    def refresh_file(self, location: str, path: str):
+        ''' Re-parse a single library file, or drop it from the catalog when it no longer exists '''
+        entry = None
+        if os.path.isfile(path):
+            try:
+                entry = parse_library_file(path)
+            except OSError as error:
+                self.errors.append(f'{path}: {error}')
+        with self.lock:
+            previous = self.libraries.get(path)
+            if previous and entry and previous['fingerprint'] == entry['fingerprint']:
+                return # touched but not changed
+            if previous:
+                self._unindex(previous)
+                del self.libraries[path]
+                del self.locations[path]
+            if entry:
+                self.libraries[path] = entry
+                self.locations[path] = location
+                self._index(entry)
+
+    def _index(self, entry: Dict):
+        for toolIndex, tool in enumerate(entry['tools']):
+            for token in _tokens(tool):
+                self.index.setdefault(token, set()).add((entry['path'], toolIndex))
+
+    def _unindex(self, entry: Dict):
+        for toolIndex, tool in enumerate(entry['tools']):
+            for token in _tokens(tool):
+                matches = self.index.get(token)
+                if matches:
+                    matches.discard((entry['path'], toolIndex))
+                    if not matches:
+                        del self.index[token]
+
+    def search(self, text: str) -> List[Dict]:
+        ''' Return the tools whose number, comment, description, product ID or type hold all words of the text '''
+        words = text.lower().split()
+        if not words:
+            return []
+        with self.lock:
+            matches = None
+            for word in words:
+                found = self.index.get(word, set())
+                matches = set(found) if matches is None else matches & found
+                if not matches:
+                    return []
+            return [{'library': self.libraries[path]['name'], 'path': path, **self.libraries[path]['tools'][toolIndex]} for path, toolIndex in sorted(matches)]
+
+def _list_library_files(directories: List[str]) -> Dict[str, tuple]:
+    ''' Return the library files below the directories with their modification time and size, bounded by MAX_WATCHED_FILES '''
+    files = {}
+    for directory in directories:
+        for root, dirs, names in os.walk(directory):
+            for name in names:
+                if name.lower().endswith(LIBRARY_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files[path] = (stat.st_mtime_ns, stat.st_size)
+                    if len(files) >= MAX_WATCHED_FILES:
+                        return files
+    return files
+
+class LibraryWatcher(threading.Thread):
+    ''' Keeps the catalog current for a set of directories. Uses inotify on Linux and polling elsewhere '''
+    def __init__(self, catalog: LibraryCatalog, directories: Dict[str, List[str]]):
+        super().__init__(daemon=True)
+        self.catalog = catalog
+        self.directories = directories # location -> directories
+        self.stopped = threading.Event()
+        self.pending = {} # path -> time of its last event
+
+    def location_of(self, path: str) -> str:
+        for location, directories in self.directories.items():
+            for directory in directories:
+                if os.path.commonpath([os.path.abspath(path), os.path.abspath(directory)]) == os.path.abspath(directory):
+                    return location
+        return None
+
+    def all_directories(self) -> List[str]:
+        return [directory for directories in self.directories.values() for directory in directories]
+
+    def run(self):
+        for path in _list_library_files(self.all_directories()):
+            self.catalog.refresh_file(self.location_of(path), path)
+        try:
+            if platform.system() == "Linux":
+                self._run_inotify()
+                return
+        except OSError as error:
+            self.catalog.errors.append(f'inotify unavailable, polling instead: {error}')
+        self._run_polling()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _queue(self, path: str):
+        if path.lower().endswith(LIBRARY_EXTENSIONS):
+            self.pending[path] = time.monotonic()
+
+    def _flush(self):
+        ''' Re-parse the files that have been quiet for DEBOUNCE_SECONDS '''
+        now = time.monotonic()
+        for path, changed in list(self.pending.items()):
+            if now - changed >= DEBOUNCE_SECONDS:
+                del self.pending[path]
+                location = self.location_of(path)
+                if location:
+                    self.catalog.refresh_file(location, path)
+
+    def _run_polling(self):
+        known = _list_library_files(self.all_directories())
+        while not self.stopped.wait(POLL_SECONDS):
+            current = _list_library_files(self.all_directories())
+            for path in set(known) | set(current):
+                if known.get(path) != current.get(path):
+                    self._queue(path)
+            known = current
+            self._flush()
+
+    def _run_inotify(self):
+        IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x8, 0x40, 0x80
+        IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_Q_OVERFLOW, IN_ISDIR = 0x100, 0x200, 0x400, 0x4000, 0x40000000
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        watches = {}
+
+        def watch(directory: str):
+            for root, dirs, names in os.walk(directory):
+                if len(watches) >= MAX_WATCHED_DIRECTORIES:
+                    return
+                wd = libc.inotify_add_watch(fd, root.encode(), mask)
+                if wd >= 0:
+                    watches[wd] = root
+
+        try:
+            for directory in self.all_directories():
+                watch(directory)
+            while not self.stopped.is_set():
+                ready, _, _ = select.select([fd], [], [], min(DEBOUNCE_SECONDS, POLL_SECONDS))
+                if ready:
+                    data = os.read(fd, 65536)
+                    offset = 0
+                    while offset < len(data):
+                        wd, eventMask, cookie, length = struct.unpack_from('iIII', data, offset)
+                        name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode(errors='replace')
+                        offset += 16 + length
+                        if eventMask & IN_Q_OVERFLOW: # events were lost, compare everything again
+                            for path in set(_list_library_files(self.all_directories())) | set(self.catalog.libraries):
+                                self._queue(path)
+                        elif wd in watches:
+                            path = os.path.join(watches[wd], name)
+                            if eventMask & IN_ISDIR:
+                                if eventMask & (IN_CREATE | IN_MOVED_TO):
+                                    watch(path)
+                            elif name:
+                                self._queue(path)
+                self._flush()
+        finally:
+            os.close(fd)
+
+# Catalog shared by all commands, kept current by the watcher between start() and stop()
+catalog = LibraryCatalog()
+_watcher = None
+
+def _existing_folders(folders: List[str]) -> List[str]:
+    existing = []
+    for folder in folders:
+        folder = folder.strip()
+        if not folder:
+            continue
+        if os.path.isdir(folder):
+            existing.append(folder)
+        else:
+            futil.log(f'Library catalog: \'{folder}\' is not a folder and is not watched')
+    return existing
+
+def start(local_folder: str, external_folders: List[str]):
+    global _watcher
+    directories = {
+        LOCAL: _existing_folders([local_folder]),
+        EXTERNAL: _existing_folders(external_folders)
+    }
+    if not directories[LOCAL] and not directories[EXTERNAL]:
+        return
+    _watcher = LibraryWatcher(catalog, directories)
+    _watcher.start()
+
+def stop():
+    global _watcher
+    if _watcher:
+        _watcher.stop()
+        _watcher = None
+
+def find_libraries(parameter_name: str, value) -> List[str]:
+    ''' Return the names of the watched libraries holding a tool whose parameter has exactly the value '''
+    field = PARAMETER_FIELDS.get(parameter_name)
+    if field is None or value is None:
+        return []
+    names = []
+    for tool in catalog.search(str(value)):
+        if str(tool[field]) == str(value) and tool['library'] not in names:
+            names.append(tool['library'])
+    return names
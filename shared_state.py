@@ -93,4 +93,13 @@ def merge_settings(default_settings, user_settings):
         # If the value itself is a dictionary, then recurse
         elif isinstance(value, dict) and isinstance(user_settings[key], dict):
             merge_settings(value, user_settings[key])
-    return user_settings
\ No newline at end of file
+    return user_settings
+
+def get_document_id(document) -> str:
+    # Document names carry the version ("Part v3"), so saved documents are identified by their data file
+    try:
+        if document.dataFile:
+            return document.dataFile.id
+    except:
+        pass # document was never saved
+    return document.name